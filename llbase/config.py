@@ -4,14 +4,109 @@ Utility module for parsing and using configuration files.
 from __future__ import print_function, absolute_import
 
 import copy
+import datetime
 import errno
+import io
 import os
 import time
+import uuid
+
+try:
+    from types import MappingProxyType
+except ImportError:
+    # Python 2
+    MappingProxyType = None
+
+try:
+    from sys import intern
+except ImportError:
+    # Python 2: intern() is a builtin
+    pass
 
 from llbase import llsd
 
 _g_config = None
 
+# the builtin, since this module defines its own set() function
+_builtin_set = set
+
+# llsd scalar types that are immutable, so can be shared rather than copied
+_IMMUTABLE_TYPES = (type(None), bool, int, float, str, bytes, uuid.UUID,
+                    datetime.date, datetime.datetime)
+
+def _fast_clone(obj):
+    """
+    Return a deep copy of llsd data obj.
+
+    Rebuilds maps and arrays directly and shares immutable scalars,
+    avoiding copy.deepcopy()'s memo bookkeeping for each object. Types
+    we don't recognize still go through copy.deepcopy().
+    """
+    t = type(obj)
+    if t is dict:
+        return dict((k, _fast_clone(v)) for k, v in obj.items())
+    if t is list:
+        return [_fast_clone(v) for v in obj]
+    if t is tuple:
+        return tuple(_fast_clone(v) for v in obj)
+    if isinstance(obj, _IMMUTABLE_TYPES):
+        return obj
+    return copy.deepcopy(obj)
+
+try:
+    # Python 3: immune to wall-clock adjustments
+    _monotonic = time.monotonic
+except AttributeError:
+    # Python 2
+    _monotonic = time.time
+
+def _intern_keys(mapping):
+    """
+    Return mapping with its str keys interned.
+
+    Lookups with literal (hence interned) keys can then match stored keys
+    by identity, without comparing string contents.
+    """
+    if type(mapping) is not dict:
+        return mapping
+    return dict(((intern(k) if type(k) is str else k), v)
+                for k, v in mapping.items())
+
+# how many files' contents Config.update() keeps parsed
+_UPDATE_CACHE_SIZE = 8
+
+def _stat_key(st):
+    """
+    What identifies one version of a file's contents for _update_cache:
+    a rewrite within the mtime's granularity still changes the size or,
+    when replaced by rename, the inode.
+    """
+    # Python 2 has no st_mtime_ns
+    return (getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size, st.st_ino)
+
+def _llsd_parses_streams():
+    """
+    Whether this llsd's parse() accepts a file, rather than only bytes.
+    """
+    try:
+        return llsd.parse(io.BytesIO(b'<?xml version="1.0" ?><llsd><map /></llsd>')) == {}
+    except Exception:
+        return False
+
+# Newer llsd releases parse directly from a stream, which spares us holding
+# the raw file contents alongside the parsed result. Older ones insist on
+# bytes. Find out which once, so that errors from parsing a real file are
+# never mistaken for the answer.
+_PARSE_STREAMS = _llsd_parses_streams()
+
+def _parse_file(config_file):
+    """
+    Parse llsd from the open binary file config_file.
+    """
+    if _PARSE_STREAMS:
+        return llsd.parse(config_file)
+    return llsd.parse(config_file.read())
+
 class Config(object):
     """
     Class for loading llsd files as configuration.
@@ -33,7 +128,15 @@ class Config(object):
     from the file and the other is whatever has been set during
     runtime. When a key is set during runtime it is treated as a
     runtime override over the file config even if the file is updated.
+    Both live in a single dictionary; the set of keys that were
+    overridden at runtime determines which entries a reload may replace.
     """
+    # fixed attribute layout: cheaper attribute access on the lookup path,
+    # and no per-instance __dict__
+    __slots__ = ('_config_filename', '_reload_check_interval',
+                 '_last_check_time', '_last_mod_time',
+                 '_override_keys', '_combined_dict', '_update_cache')
+
     def __init__(self, config_filename):
         """
         Construct a new Config object with config_filename for state.
@@ -46,9 +149,12 @@ class Config(object):
         self._last_check_time = 0
         self._last_mod_time = 0
 
-        self._config_overrides = {}
-        self._config_file_dict = {}
+        # keys set via set() or update(): reloading the file won't touch them
+        self._override_keys = _builtin_set()
         self._combined_dict = {}
+        # filename passed to update() -> (_stat_key(), parsed contents),
+        # holding at most _UPDATE_CACHE_SIZE files
+        self._update_cache = {}
 
         self._load()
 
@@ -57,13 +163,24 @@ class Config(object):
         if self._config_filename is None:
             return
 
-        config_file = open(self._config_filename, 'rb')
-        self._config_file_dict = llsd.parse(config_file.read())
-        self._combine_dictionaries()
-        config_file.close()
-
-        self._last_mod_time = self._get_last_modified_time()
-        self._last_check_time = time.time() # now
+        with open(self._config_filename, 'rb') as config_file:
+            # stat the file we actually opened: no second path lookup, and
+            # the mtime can't describe a newer file than the one we parse
+            mod_time = os.fstat(config_file.fileno()).st_mtime
+            file_dict = _intern_keys(_parse_file(config_file)) or {}
+
+        combined = self._combined_dict
+        overrides = self._override_keys
+        # drop file-originated keys that the file no longer has
+        for key in [key for key in combined
+                    if key not in overrides and key not in file_dict]:
+            del combined[key]
+        for key, value in file_dict.items():
+            if key not in overrides:
+                combined[key] = value
+
+        self._last_mod_time = mod_time
+        self._last_check_time = _monotonic() # now
 
     def _get_last_modified_time(self):
         """
@@ -71,19 +188,9 @@ class Config(object):
         such exists.
         """
         if self._config_filename is not None:
-            return os.path.getmtime(self._config_filename)
+            return os.stat(self._config_filename).st_mtime
         return 0
 
-    def _combine_dictionaries(self):
-        """
-        Bring the defaults and overrides togeter into a combined
-        dictionary.
-        """
-        self._combined_dict = {}
-        if(self._config_file_dict):
-            self._combined_dict.update(self._config_file_dict)
-        self._combined_dict.update(self._config_overrides)
-
     def _reload_if_necessary(self):
         """
         Reload config if the check interval has expired and file is
@@ -92,20 +199,26 @@ class Config(object):
         If the file goes missing, this is probably a transient error
         so the old config is kept until reload succeeds.
         """
-        now = time.time()
-        if (now - self._last_check_time) > self._reload_check_interval:
-            self._last_check_time = now
-            try:
-                modtime = self._get_last_modified_time()
-                if modtime > self._last_mod_time:
-                    self._load()
-            except OSError as exc:
-                if exc.errno == errno.ENOENT: # file not found
-                    print('WARNING: Configuration file missing:', end=' ')
-                    print(self._config_filename)
-                    self._last_mod_time = 0
-                else:
-                    raise  # pass the exception along to the caller
+        if self._config_filename is None:
+            # nothing to reload
+            return
+
+        now = _monotonic()
+        if now <= self._last_check_time + self._reload_check_interval:
+            return
+
+        self._last_check_time = now
+        try:
+            modtime = self._get_last_modified_time()
+            if modtime > self._last_mod_time:
+                self._load()
+        except OSError as exc:
+            if exc.errno == errno.ENOENT: # file not found
+                print('WARNING: Configuration file missing:', end=' ')
+                print(self._config_filename)
+                self._last_mod_time = 0
+            else:
+                raise  # pass the exception along to the caller
 
     def __getitem__(self, key):
         """
@@ -123,10 +236,10 @@ class Config(object):
         :param key: string key for the value to get.
         :param default: Default value to return if key not in config.
         """
-        try:
-            return self.__getitem__(key)
-        except KeyError:
-            return default
+        # look up directly rather than catching KeyError from __getitem__:
+        # missing keys are common, and exceptions are costly
+        self._reload_if_necessary()
+        return self._combined_dict.get(key, default)
 
     def __setitem__(self, key, value):
         """
@@ -139,8 +252,8 @@ class Config(object):
         that key/value pair will remain set with that value until
         change via the update or set method
         """
-        self._config_overrides[key] = value
-        self._combine_dictionaries()
+        self._combined_dict[key] = value
+        self._override_keys.add(key)
 
     def set(self, key, newval):
         """
@@ -172,19 +285,41 @@ class Config(object):
         if isinstance(new_conf, dict):
             overrides = new_conf
         elif llsd.is_string(new_conf):
-            config_file = open(new_conf, 'rb')
-            overrides = llsd.parse(config_file.read())
-            config_file.close()
+            with open(new_conf, 'rb') as config_file:
+                key = _stat_key(os.fstat(config_file.fileno()))
+                cache = self._update_cache
+                cached = cache.get(new_conf)
+                if cached is not None and cached[0] == key:
+                    # same file as last time: don't bother reparsing
+                    parsed = cached[1]
+                else:
+                    parsed = _parse_file(config_file)
+                    if len(cache) >= _UPDATE_CACHE_SIZE:
+                        cache.clear()
+                    cache[new_conf] = (key, parsed)
+            # The config's values are handed out by get() and may be
+            # modified in place: keep the cached copy to ourselves.
+            overrides = _fast_clone(parsed)
         else:
             # assume it is a file-like object
-            overrides = llsd.parse(new_conf.read())
+            overrides = _parse_file(new_conf)
     
-        self._config_overrides.update(overrides)
-        self._combine_dictionaries()
+        self._combined_dict.update(overrides)
+        self._override_keys.update(overrides)
 
-    def as_dict(self):
-        "Returns immutable copy of the combined config as a dictionary."
-        return copy.deepcopy(self._combined_dict)
+    def as_dict(self, readonly=False):
+        """
+        Returns immutable copy of the combined config as a dictionary.
+
+        :param readonly: if True, instead return a read-only view of the
+           combined config without copying anything. The view reflects
+           later changes to the config, and nested values are the
+           config's own: don't modify them. Python 2 has no read-only
+           view, so there this still returns a copy.
+        """
+        if readonly and MappingProxyType is not None:
+            return MappingProxyType(self._combined_dict)
+        return _fast_clone(self._combined_dict)
 
 def load(config_xml_file):
     """
@@ -195,16 +330,22 @@ def load(config_xml_file):
     global _g_config
     _g_config = Config(config_xml_file)
 
+def _get_config():
+    """
+    Return the module config, creating an empty one on first use.
+    """
+    global _g_config
+    if _g_config is None:
+        _g_config = Config(None)
+    return _g_config
+
 def update(new_conf):
     """
     Updates new_conf into the module config.
 
     :param new_conf: dict configuration to update into the current config.
     """
-    global _g_config
-    if _g_config is None:
-        _g_config = Config(None)
-    return _g_config.update(new_conf)
+    return _get_config().update(new_conf)
 
 def get(key, default = None):
     """
@@ -213,10 +354,12 @@ def get(key, default = None):
     :param key: The key of the config value to get
     :param default: What to return if key is not found.
     """
-    global _g_config
-    if _g_config is None:
-        _g_config = Config(None)
-    return _g_config.get(key, default)
+    conf = _g_config
+    if conf is None:
+        # nothing has been loaded or set: no need to create a config just
+        # to report that key is missing
+        return default
+    return conf.get(key, default)
 
 def set(key, newval):
     """
@@ -229,7 +372,4 @@ def set(key, newval):
     that key/value pair will remain set with that value until
     change via the update or set method or program termination
     """
-    global _g_config
-    if _g_config is None:
-        _g_config = Config(None)
-    _g_config.set(key, newval)
+    _get_config().set(key, newval)
@@ -9,14 +9,13 @@ from __future__ import absolute_import
 import datetime
 import re
 import uuid
-from functools import total_ordering
+from itertools import chain, cycle, islice, repeat
 
 from llbase import llsd
 
 NoneType = type(None)
 StringTypes = llsd.StringTypes
 
-@total_ordering
 class _Result(object):
     """
     The result of a llsd/llidl spciciation comparison
@@ -36,42 +35,82 @@ class _Result(object):
         INCOMPATIBLE: there were values that just didn't match and can't
             be converted        
     """
-    def __init__(self, value, name):
-        self._value = value
+    # The only instances are the module constants below, so equality is
+    # identity.
+    __slots__ = ('_order', '_rank', '_flags', '_name', '_repr')
+
+    def __init__(self, order, rank, flags, name):
+        # _order is the total ordering used by comparisons; _rank is the
+        # severity used by __and__(), which DEFAULTED and ADDITIONAL share,
+        # told apart by their _flags bit
+        self._order = order
+        self._rank = rank
+        self._flags = flags
         self._name = name
+        self._repr = "llidl." + name
     
     def __repr__(self):
-        return "llidl." + self._name
+        return self._repr
         
     def __str__(self):
         return self._name
 
+    __hash__ = object.__hash__
+
     def __eq__(self, other):
-        return self._value == other._value
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
 
     def __lt__(self, other):
-        return self._value < other._value
+        return self._order < other._order
+
+    def __le__(self, other):
+        return self._order <= other._order
+
+    def __gt__(self, other):
+        return self._order > other._order
+
+    def __ge__(self, other):
+        return self._order >= other._order
 
     def __and__(self, other):
-        sv = int(self._value)
-        ov = int(other._value)
+        sv = self._rank
+        ov = other._rank
         if sv < ov: return self
         if ov < sv: return other
-        if self._value != other._value:
+        # both DEFAULTED and ADDITIONAL were seen
+        if self._flags | other._flags == _MIXED_FLAGS:
             return MIXED
         return self
 
     def __or__(self, other):
-        if self._value >= other._value:
+        if self._order >= other._order:
             return self
         return other
 
-MATCHED         = _Result(4, "MATCHED")
-CONVERTED       = _Result(3, "CONVERTED")
-DEFAULTED       = _Result(2.2, "DEFAULTED")
-ADDITIONAL      = _Result(2.1, "ADDITIONAL")
-MIXED           = _Result(1, "MIXED")
-INCOMPATIBLE    = _Result(0, "INCOMPATIBLE")
+    # Copies must stay the module constant for identity equality to hold:
+    # pickle by reference to the constant's name, and copy to self.
+    def __reduce__(self):
+        return self._name
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+_DEFAULTED_FLAG = 1
+_ADDITIONAL_FLAG = 2
+_MIXED_FLAGS = _DEFAULTED_FLAG | _ADDITIONAL_FLAG
+
+MATCHED         = _Result(5, 4, 0, "MATCHED")
+CONVERTED       = _Result(4, 3, 0, "CONVERTED")
+DEFAULTED       = _Result(3, 2, _DEFAULTED_FLAG, "DEFAULTED")
+ADDITIONAL      = _Result(2, 2, _ADDITIONAL_FLAG, "ADDITIONAL")
+MIXED           = _Result(1, 1, _MIXED_FLAGS, "MIXED")
+INCOMPATIBLE    = _Result(0, 0, 0, "INCOMPATIBLE")
 
 
 class MatchError(Exception):
@@ -94,7 +133,9 @@ class MatchErrorStack(Exception):
             self.stack=[ (vtype, val) ] 
 
     def push(self, vtype, val):
-        self.stack.insert(0, ( vtype, val ) )
+        # stack is innermost first: appending avoids shifting the whole list
+        # on each push, and format_stack() walks it in reverse
+        self.stack.append( ( vtype, val ) )
 
     def format_entry(self, klass, val):
         if type(klass) == tuple:
@@ -104,7 +145,7 @@ class MatchErrorStack(Exception):
             return "%s (%s)" % (klass.__name__, val)
 
     def format_stack(self, paths, path, stack):
-        for entry in stack:
+        for entry in reversed(stack):
             if len(entry) == 3:
                 klass, val, r = entry
                 paths.append("%s <<%s>>" % (' -> '.join(path + [self.format_entry(klass, val)]), r))
@@ -160,6 +201,8 @@ class Value(object):
     The above three tests are primarily for unit testing and do not support
     the raises feature.
     """
+    # lets the scalar matchers below do without a per-instance __dict__
+    __slots__ = ()
     
     def _set_suite(self, suite):
         pass
@@ -170,6 +213,13 @@ class Value(object):
     def _compare(self, actual, raise_level=None):
         """Compare an LLSD value to the value spec.; return a Result"""
         return INCOMPATIBLE
+
+    def _compare_fast(self, actual):
+        """
+        Same as _compare(actual) with raise_level=None: never raises
+        MatchErrorStack, and so can skip all the bookkeeping for it.
+        """
+        return self._compare(actual)
     
     def _failure(self, raises, message):
         if raises is not None:
@@ -182,11 +232,10 @@ class Value(object):
     
     def match(self, actual, raises=None, match_level=CONVERTED):
         """Return True if the value matches exactly"""
-        raise_level=None
-        if raises is not None:
-            raise_level=match_level
+        if raises is None:
+            return self._compare_fast(actual) >= match_level
         try:
-            return (self._compare(actual, raise_level=raise_level) >= match_level
+            return (self._compare(actual, raise_level=match_level) >= match_level
                  or self._failure(raises, "did not match"))
         except MatchErrorStack as e:
             return self._failure(raises, str(e))
@@ -197,295 +246,353 @@ class Value(object):
 
     def has_additional(self, actual):
         """Return True if the value has additional data"""
-        r = self._compare(actual)
+        r = self._compare_fast(actual)
         return r == ADDITIONAL or r == MIXED
 
     def has_defaulted(self, actual):
         """Return True if the value has defaulted (missing) data"""
-        r = self._compare(actual)
+        r = self._compare_fast(actual)
         return r == DEFAULTED or r == MIXED
     
     def incompatible(self, actual):
         """Return True if the value is incompatible"""
-        return self._compare(actual) == INCOMPATIBLE
+        return self._compare_fast(actual) == INCOMPATIBLE
     
 
 
 class _UndefMatcher(Value):
+    __slots__ = ()
+
     def _compare(self, actual, raise_level=None):
         return MATCHED    # every value matches undef
 
+    def _compare_fast(self, actual):
+        return MATCHED
 
-class _BoolMatcher(Value):
-    def _compare(self, actual, raise_level=None):
-        t = type(actual)
-        r = INCOMPATIBLE
-        if t == NoneType:
-            r = DEFAULTED
-        elif t == bool:
-            r = MATCHED
-        elif t == int:
-            if actual == 0 or actual == 1:
-                r = CONVERTED
-        elif t == float:
-            if actual == 0.0 or actual == 1.0:
-                r = CONVERTED
-        elif t in StringTypes:
-            if actual == "" or actual == "true":
-                r = CONVERTED
-        if raise_level is not None and r < raise_level:
-            raise MatchErrorStack(vtype=self.__class__, val=actual, r=r)
-        return r
 
+def _types_table(*entries):
+    """
+    Build a _ScalarMatcher._types table from (type, result) pairs. A type of
+    StringTypes stands for each of the string types.
+    """
+    table = {}
+    for t, r in entries:
+        if t is StringTypes:
+            for s in StringTypes:
+                table[s] = r
+        else:
+            table[t] = r
+    return table
 
-class _TrueMatcher(Value):
-    def _compare(self, actual, raise_level=None):
-        t = type(actual)
-        r = INCOMPATIBLE
-        if t == NoneType:
+
+def _memoized(fn):
+    """
+    Decorate a _ScalarMatcher._types function of a string so that its results
+    are remembered per matcher instance. Validation tends to see the same
+    strings over and over, and the conversions and regex matches that judge
+    them cost far more than a dict lookup.
+
+    Only strings up to _MEMO_MAX_LEN long are remembered: those are the
+    repetitive ones (uuids, dates, numbers), and the matchers are shared
+    module-wide, so the memo mustn't pin arbitrarily large payloads. The
+    matchers may be used from several threads; each dict operation here is
+    atomic, and a lost or cleared entry only costs a recomputation.
+    """
+    def wrapper(self, actual):
+        if len(actual) > _MEMO_MAX_LEN:
+            return fn(self, actual)
+        memo = self._memo
+        try:
+            return memo[actual]
+        except KeyError:
             pass
-        elif t == bool:
-            if actual:
-                r = MATCHED
-        elif t == int:
-            if actual == 1:
-                r = CONVERTED
-        elif t == float:
-            if actual == 1.0:
-                r = CONVERTED
-        elif t in StringTypes:
-            if actual == "true":
-                r = CONVERTED
-        if raise_level is not None and r < raise_level:
-            raise MatchErrorStack(vtype=(self.__class__, True), val=actual, r=r)
+        if len(memo) >= _MEMO_SIZE:
+            memo.clear()
+        r = memo[actual] = fn(self, actual)
         return r
+    return wrapper
 
-   
-class _FalseMatcher(Value):
-    def _compare(self, actual, raise_level=None):
-        t = type(actual)
-        r = INCOMPATIBLE
-        if t == NoneType:
-            r = DEFAULTED
-        elif t == bool:
-            if not actual:
-                r = MATCHED
-        elif t == int:
-            if actual == 0:
-                r = CONVERTED
-        elif t == float:
-            if actual == 0.0:
-                r = CONVERTED
-        elif t in StringTypes:
-            if actual == "":
-                r = CONVERTED
-        if raise_level is not None and r < raise_level:
-            raise MatchErrorStack(vtype=self.__class__, val=actual, r=r)
-        return r
+_MEMO_SIZE = 1024
+_MEMO_MAX_LEN = 64
 
 
-class _IntMatcher(Value):
+class _ScalarMatcher(Value):
+    """
+    Base for matchers of a single llsd value, which look up how to treat the
+    value by its type.
+    """
+    __slots__ = ('_memo',)
+
+    def __init__(self):
+        # see _memoized()
+        self._memo = {}
+
+    # type(actual) -> either the _Result for every value of that type, or a
+    # function(self, actual) returning the _Result for that value
+    _types = {}
+    # the _Result for types not in _types
+    _other = INCOMPATIBLE
+    # the type that always MATCHES, checked ahead of the _types lookup
+    _matched_type = None
+
+    def _vtype(self):
+        """What to report as the vtype of a MatchErrorStack"""
+        return self.__class__
+
+    def _compare_fast(self, actual):
+        if type(actual) is self._matched_type:
+            return MATCHED
+        r = self._types.get(type(actual), self._other)
+        if type(r) is not _Result:
+            r = r(self, actual)
+        return r
+
     def _compare(self, actual, raise_level=None):
-        t = type(actual)
-        r = INCOMPATIBLE
-        if t == NoneType:
-            r = DEFAULTED
-        elif t == bool:
-            r = CONVERTED
-        elif t == int:
-            r = MATCHED
-        elif t == float:
-            try:
-                i = int(actual)
-                if actual == i and type(i) == int:
-                    r = CONVERTED
-            except:
-                pass
-        elif t in StringTypes:
-            try:
-                f = float(actual)
-                i = int(f)
-                if f == i and type(i) == int:
-                    r = CONVERTED
-            except:
-                if actual == "":
-                    r = DEFAULTED
+        r = self._compare_fast(actual)
         if raise_level is not None and r < raise_level:
-            raise MatchErrorStack(vtype=self.__class__, val=actual, r=r)
+            raise MatchErrorStack(vtype=self._vtype(), val=actual, r=r)
         return r
 
 
-class _NumberMatcher(Value):
+class _BoolMatcher(_ScalarMatcher):
+    __slots__ = ()
+    _matched_type = bool
+    _types = _types_table(
+        (NoneType,      DEFAULTED),
+        (bool,          MATCHED),
+        (int,           lambda self, actual:
+                            CONVERTED if actual == 0 or actual == 1 else INCOMPATIBLE),
+        (float,         lambda self, actual:
+                            CONVERTED if actual == 0.0 or actual == 1.0 else INCOMPATIBLE),
+        (StringTypes,   lambda self, actual:
+                            CONVERTED if actual == "" or actual == "true" else INCOMPATIBLE),
+        )
+
+
+class _TrueMatcher(_ScalarMatcher):
+    __slots__ = ()
+    _types = _types_table(
+        (bool,          lambda self, actual: MATCHED if actual else INCOMPATIBLE),
+        (int,           lambda self, actual: CONVERTED if actual == 1 else INCOMPATIBLE),
+        (float,         lambda self, actual: CONVERTED if actual == 1.0 else INCOMPATIBLE),
+        (StringTypes,   lambda self, actual:
+                            CONVERTED if actual == "true" else INCOMPATIBLE),
+        )
+
+    def _vtype(self):
+        return (self.__class__, True)
+
+   
+class _FalseMatcher(_ScalarMatcher):
+    __slots__ = ()
+    _types = _types_table(
+        (NoneType,      DEFAULTED),
+        (bool,          lambda self, actual: INCOMPATIBLE if actual else MATCHED),
+        (int,           lambda self, actual: CONVERTED if actual == 0 else INCOMPATIBLE),
+        (float,         lambda self, actual: CONVERTED if actual == 0.0 else INCOMPATIBLE),
+        (StringTypes,   lambda self, actual: CONVERTED if actual == "" else INCOMPATIBLE),
+        )
+
+
+def _int_from_float(self, actual):
+    try:
+        i = int(actual)
+        if actual == i and type(i) == int:
+            return CONVERTED
+    except:
+        pass
+    return INCOMPATIBLE
+
+# The finite numbers float() accepts. Strings that don't match this can't
+# convert to an int, so they're rejected without raising and catching.
+_digits = r'\d(?:_?\d)*'
+_numericRE = re.compile(r'\s*[+-]?(?:%s(?:\.(?:%s)?)?|\.%s)(?:[eE][+-]?%s)?\s*\Z'
+                        % (_digits, _digits, _digits, _digits))
+
+@_memoized
+def _int_from_string(self, actual):
+    if actual == "":
+        return DEFAULTED
+    if not _numericRE.match(actual):
+        return INCOMPATIBLE
+    try:
+        f = float(actual)
+        i = int(f)
+        if f == i and type(i) == int:
+            return CONVERTED
+    except:
+        pass
+    return INCOMPATIBLE
+
+class _IntMatcher(_ScalarMatcher):
+    __slots__ = ()
+    _matched_type = int
+    _types = _types_table(
+        (NoneType,      DEFAULTED),
+        (bool,          CONVERTED),
+        (int,           MATCHED),
+        (float,         _int_from_float),
+        (StringTypes,   _int_from_string),
+        )
+
+
+@_memoized
+def _number_from_string(self, actual):
+    if actual == "":
+        return self._number_result(0, DEFAULTED)
+    if not _numericRE.match(actual):
+        return INCOMPATIBLE
+    try:
+        n = int(float(actual))
+    except:
+        return INCOMPATIBLE
+    return self._number_result(n, CONVERTED)
+
+class _NumberMatcher(_ScalarMatcher):
+    __slots__ = ('_number',)
+    _types = _types_table(
+        (NoneType,      lambda self, actual: self._number_result(0, DEFAULTED)),
+        (bool,          lambda self, actual:
+                            self._number_result(actual and 1 or 0, CONVERTED)),
+        (int,           lambda self, actual: self._number_result(actual, MATCHED)),
+        (float,         lambda self, actual: self._number_result(int(actual), CONVERTED)),
+        (StringTypes,   _number_from_string),
+        )
+
     def __init__(self, number):
+        super(_NumberMatcher, self).__init__()
         self._number = int(number)
-        
-    def _compare(self, actual, raise_level=None):
-        n = 0
-        r = CONVERTED
-        
-        t = type(actual)
-        if t == NoneType:
-            n = 0
-            r = DEFAULTED
-        elif t == bool:
-            n = actual and 1 or 0
-            r = CONVERTED
-        elif t == int:
-            n = actual
-            r = MATCHED
-        elif t == float:
-            n = int(actual)
-            r = CONVERTED
-        elif t in StringTypes:
-            try:
-                n = int(float(actual))
-                r = CONVERTED
-            except:
-                if actual == "":
-                    n = 0
-                    r = DEFAULTED
-                else:
-                    r = INCOMPATIBLE
-        else:
-            r = INCOMPATIBLE
-        
-        if r != INCOMPATIBLE:
-            if n != self._number:
-                r = INCOMPATIBLE
-        if raise_level is not None and r < raise_level:
-            raise MatchErrorStack(vtype=(self.__class__, self._number), val=actual, r=r)
-        return r
 
-                
-class _RealMatcher(Value):
-    def _compare(self, actual, raise_level=None):
-        t = type(actual)
-        r = INCOMPATIBLE
-        if t == NoneType:
-            r = DEFAULTED
-        elif t == bool:
-            r = CONVERTED
-        elif t == int:
-            r = CONVERTED
-        elif t == float:
-            r = MATCHED
-        elif t in StringTypes:
-            try:
-                f = float(actual)
-                r = CONVERTED
-            except:
-                if actual == "":
-                    return DEFAULTED
-        if raise_level is not None and r < raise_level:
-            raise MatchErrorStack(vtype=self.__class__, val=actual, r=r)
-        return r
+    def _number_result(self, n, r):
+        return r if n == self._number else INCOMPATIBLE
 
+    def _compare_fast(self, actual):
+        # an int is by far the usual payload for a number literal
+        if type(actual) is int:
+            return MATCHED if actual == self._number else INCOMPATIBLE
+        return super(_NumberMatcher, self)._compare_fast(actual)
 
-class _StringMatcher(Value):
-    def _compare(self, actual, raise_level=None):
-        t = type(actual)
-        r = CONVERTED
-        if t == NoneType:
-            r = DEFAULTED
-        elif t in StringTypes:
-            r = MATCHED
-        elif t == llsd.binary:
-            r = INCOMPATIBLE
-        if raise_level is not None and r < raise_level:
-            raise MatchErrorStack(vtype=self.__class__, val=actual, r=r)
-        return r
+    def _vtype(self):
+        return (self.__class__, self._number)
 
+                
+@_memoized
+def _real_from_string(self, actual):
+    try:
+        float(actual)
+        return CONVERTED
+    except:
+        if actual == "":
+            return DEFAULTED
+    return INCOMPATIBLE
+
+class _RealMatcher(_ScalarMatcher):
+    __slots__ = ()
+    _matched_type = float
+    _types = _types_table(
+        (NoneType,      DEFAULTED),
+        (bool,          CONVERTED),
+        (int,           CONVERTED),
+        (float,         MATCHED),
+        (StringTypes,   _real_from_string),
+        )
+
+
+class _StringMatcher(_ScalarMatcher):
+    __slots__ = ()
+    _matched_type = str
+    _types = _types_table(
+        (NoneType,      DEFAULTED),
+        (StringTypes,   MATCHED),
+        (llsd.binary,   INCOMPATIBLE),
+        )
+    _other = CONVERTED
+
+
+def _name_from_none(self, actual):
+    return DEFAULTED if self._name == "" else INCOMPATIBLE
+
+def _name_from_string(self, actual):
+    return MATCHED if self._name == actual else INCOMPATIBLE
+
+class _NameMatcher(_ScalarMatcher):
+    __slots__ = ('_name',)
+    _types = _types_table(
+        (NoneType,      _name_from_none),
+        (StringTypes,   _name_from_string),
+        )
 
-class _NameMatcher(Value):
     def __init__(self, name):
+        super(_NameMatcher, self).__init__()
         self._name = str(name)
 
-    def _compare(self, actual, raise_level=None):
-        t = type(actual)
-        r = INCOMPATIBLE
-        if t == NoneType:
-            if self._name == "":
-                r = DEFAULTED
-        elif t in StringTypes:
-            if self._name == actual:
-                r = MATCHED
-        if raise_level is not None and r < raise_level:
-            raise MatchErrorStack(vtype=(self.__class__, self._name), val=actual, r=r)
-        return r
+    def _vtype(self):
+        return (self.__class__, self._name)
 
 
 
-class _DateMatcher(Value):
-    
-    _dateRE = re.compile(r'\d\d\d\d-\d\d-\d\dT\d\d:\d\d:\d\d(.\d+)?Z');
-    
-    def _compare(self, actual, raise_level=None):
-        t = type(actual)
-        r = INCOMPATIBLE
-        if t == NoneType:
-            r = DEFAULTED
-        elif t in StringTypes:
-            if self._dateRE.match(actual):
-                r = CONVERTED
-            elif actual == "":
-                r = DEFAULTED
-        elif t == datetime.datetime or t == datetime.date:
-            r = MATCHED
-        if raise_level is not None and r < raise_level:
-            raise MatchErrorStack(vtype=self.__class__, val=actual, r=r)
-        return r
+@_memoized
+def _date_from_string(self, actual):
+    # no string shorter than the shortest date can match; skip the regex
+    if len(actual) >= 20 and self._dateRE.match(actual):
+        return CONVERTED
+    if actual == "":
+        return DEFAULTED
+    return INCOMPATIBLE
 
+class _DateMatcher(_ScalarMatcher):
+    __slots__ = ()
+    _matched_type = datetime.datetime
 
-class _UUIDMatcher(Value):
+    _dateRE = re.compile(r'\d\d\d\d-\d\d-\d\dT\d\d:\d\d:\d\d(.\d+)?Z');
     
+    _types = _types_table(
+        (NoneType,          DEFAULTED),
+        (StringTypes,       _date_from_string),
+        (datetime.datetime, MATCHED),
+        (datetime.date,     MATCHED),
+        )
+
+
+@_memoized
+def _uuid_from_string(self, actual):
+    # no string shorter than a uuid can match; skip the regex
+    if len(actual) >= 36 and self._uuidRE.match(actual):
+        return CONVERTED
+    if actual == "":
+        return DEFAULTED
+    return INCOMPATIBLE
+
+class _UUIDMatcher(_ScalarMatcher):
+    __slots__ = ()
+    _matched_type = uuid.UUID
+
     _uuidRE = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}');
     
-    def _compare(self, actual, raise_level=None):
-        t = type(actual)
-        r = INCOMPATIBLE
-        if t == NoneType:
-            r = DEFAULTED
-        elif t in StringTypes:
-            if self._uuidRE.match(actual):
-                r = CONVERTED
-            elif actual == "":
-                r = DEFAULTED
-        elif t == uuid.UUID:
-            r = MATCHED
-        if raise_level is not None and r < raise_level:
-            raise MatchErrorStack(vtype=self.__class__, val=actual, r=r)
-        return r
+    _types = _types_table(
+        (NoneType,      DEFAULTED),
+        (StringTypes,   _uuid_from_string),
+        (uuid.UUID,     MATCHED),
+        )
 
 
-class _URIMatcher(Value):
-    def _compare(self, actual, raise_level=None):
-        t = type(actual)
-        r = INCOMPATIBLE
-        if t == NoneType:
-            r = DEFAULTED
-        elif t in StringTypes:
-            if actual == "":
-                r = DEFAULTED
-            else:
-                r = CONVERTED
-        elif t == llsd.uri:
-            r = MATCHED
-        if raise_level is not None and r < raise_level:
-            raise MatchErrorStack(vtype=self.__class__, val=actual, r=r)
-        return r
+class _URIMatcher(_ScalarMatcher):
+    __slots__ = ()
+    _matched_type = llsd.uri
+    _types = _types_table(
+        (NoneType,      DEFAULTED),
+        (StringTypes,   lambda self, actual: DEFAULTED if actual == "" else CONVERTED),
+        (llsd.uri,      MATCHED),
+        )
 
 
-class _BinaryMatcher(Value):
-    def _compare(self, actual, raise_level=None):
-        t = type(actual)
-        r = INCOMPATIBLE
-        if t == NoneType:
-            r = DEFAULTED
-        elif t == llsd.binary:
-            r = MATCHED
-        if raise_level is not None and r < raise_level:
-            raise MatchErrorStack(vtype=self.__class__, val=actual, r=r)
-        return r
+class _BinaryMatcher(_ScalarMatcher):
+    __slots__ = ()
+    _matched_type = llsd.binary
+    _types = _types_table(
+        (NoneType,      DEFAULTED),
+        (llsd.binary,   MATCHED),
+        )
 
 
 def _roundup(value, multiple):
@@ -493,9 +600,15 @@ def _roundup(value, multiple):
     
 
 class _ArrayMatcher(Value):
+    __slots__ = ('_values', '_repeating', '_compare_fast_fns', '_compare_fns')
+
     def __init__(self, values, repeating):
         self._values = values
         self._repeating = repeating
+        # bound methods, saving an attribute lookup per element; _set_suite()
+        # only updates the values in place, so these stay valid
+        self._compare_fast_fns = tuple(v._compare_fast for v in values)
+        self._compare_fns = tuple(v._compare for v in values)
     
     def _set_suite(self, suite):
         for v in self._values:
@@ -507,10 +620,42 @@ class _ArrayMatcher(Value):
             s |= v._variants_referenced()
         return s
             
+    def _pairs(self, fns, actual, tlen):
+        """
+        Pair each of the first tlen elements of actual, padded with None, with
+        the compare function (from fns, corresponding to our values) it must
+        pass, cycling through fns. Iteration happens in C rather than by
+        indexing in Python.
+        """
+        return zip(islice(cycle(fns), tlen),
+                   chain(actual, repeat(None)))
+
+    def _compare_fast(self, actual):
+        if actual is None:
+            actual = []
+        if actual.__class__ is not list:
+            return INCOMPATIBLE
+
+        r = MATCHED
+
+        vlen = len(self._values)
+        alen = len(actual)
+        tlen = vlen
+        if self._repeating:
+            tlen = _roundup(alen, vlen)
+        elif alen > vlen:
+            r &= ADDITIONAL
+
+        for compare, v in self._pairs(self._compare_fast_fns, actual, tlen):
+            r &= compare(v)
+        return r
+
     def _compare(self, actual, raise_level=None):
+        if raise_level is None:
+            return self._compare_fast(actual)
         if actual is None:
             actual = []
-        if type(actual) != list:
+        if actual.__class__ is not list:
             if raise_level is not None:
                 raise MatchErrorStack(vtype=self.__class__, val=actual, r=INCOMPATIBLE)
             return INCOMPATIBLE
@@ -527,21 +672,26 @@ class _ArrayMatcher(Value):
             if raise_level is not None and r < raise_level:
                 raise MatchErrorStack(vtype=self.__class__, val=actual, r=ADDITIONAL)
             
-        for i in range(0,tlen):
-            v = None
-            if i < alen:
-                v = actual[i]
+        for i, (compare, v) in enumerate(self._pairs(self._compare_fns, actual, tlen)):
             try:
-                r &= self._values[i%vlen]._compare(v, raise_level=raise_level)
+                r &= compare(v, raise_level=raise_level)
             except MatchErrorStack as e:
                 e.push(vtype=self.__class__, val=i)
                 raise
         return r
 
         
+# distinguishes a missing map key from one whose value is None
+_MISSING = object()
+
 class _MapMatcher(Value):
+    __slots__ = ('_members', '_member_fast_fns')
+
     def __init__(self, members):
         self._members = members
+        # see _ArrayMatcher.__init__()
+        self._member_fast_fns = tuple((name, v._compare_fast)
+                                      for name, v in members.items())
     
     def _set_suite(self, suite):
         for v in self._members.values():
@@ -554,37 +704,68 @@ class _MapMatcher(Value):
         return s
             
 
+    def _compare_fast(self, actual):
+        if actual is None:
+            actual = {}
+        if actual.__class__ is not dict:
+            return INCOMPATIBLE
+
+        r = MATCHED
+        found = 0
+        for (name, compare) in self._member_fast_fns:
+            v = actual.get(name, _MISSING)
+            if v is _MISSING:
+                v = None
+            else:
+                found += 1
+            r &= compare(v)
+        # any keys of actual we didn't look up are additional
+        if found < len(actual):
+            r &= ADDITIONAL
+        return r
+
     def _compare(self, actual, raise_level=None):
+        if raise_level is None:
+            return self._compare_fast(actual)
         if actual is None:
             actual = {}
-        if type(actual) != dict:
+        if actual.__class__ is not dict:
             if raise_level is not None:
                 raise MatchErrorStack(vtype=self.__class__, val=actual, r=INCOMPATIBLE)
             return INCOMPATIBLE
         
         r = MATCHED
+        found = 0
         for (name, value) in self._members.items():
-            v = None
-            if name in actual:
-                v = actual[name]
+            v = actual.get(name, _MISSING)
+            if v is _MISSING:
+                v = None
+            else:
+                found += 1
             try:
                 r &= value._compare(v, raise_level=raise_level)
             except MatchErrorStack as e:
                 e.push(vtype=self.__class__, val=name)
                 raise e
-        # iterates through keys
-        for name in actual:
-            if name not in self._members:
-                r &= ADDITIONAL
-                if raise_level is not None and r < raise_level:
-                    raise MatchErrorStack(vtype=self.__class__, val=name, r=ADDITIONAL)
-                break
+        # any keys of actual we didn't look up are additional
+        if found < len(actual):
+            r &= ADDITIONAL
+            if r < raise_level:
+                # only now do we need to know which key
+                for name in actual:
+                    if name not in self._members:
+                        raise MatchErrorStack(vtype=self.__class__, val=name, r=ADDITIONAL)
         return r
 
 
 class _DictMatcher(Value):
+    __slots__ = ('_value', '_value_compare_fast', '_value_compare')
+
     def __init__(self, value):
         self._value = value
+        # bound methods, hoisting the attribute lookups out of the loops
+        self._value_compare_fast = value._compare_fast
+        self._value_compare = value._compare
     
     def _set_suite(self, suite):
         self._value._set_suite(suite)
@@ -592,16 +773,34 @@ class _DictMatcher(Value):
     def _variants_referenced(self):
         return self._value._variants_referenced()
         
+    def _compare_fast(self, actual):
+        if actual is None:
+            actual = {}
+        if actual.__class__ is not dict:
+            return INCOMPATIBLE
+
+        compare = self._value_compare_fast
+        r = MATCHED
+        for v in actual.values():
+            r &= compare(v)
+            # nothing can raise INCOMPATIBLE, so stop looking
+            if r is INCOMPATIBLE:
+                break
+        return r
+
     def _compare(self, actual, raise_level=None):
+        if raise_level is None:
+            return self._compare_fast(actual)
         if actual is None:
             actual = {}
-        if type(actual) != dict:
+        if actual.__class__ is not dict:
             return INCOMPATIBLE
         
+        compare = self._value_compare
         r = MATCHED
         for (k, v) in actual.items():
             try:
-                r &= self._value._compare(v, raise_level=raise_level)
+                r &= compare(v, raise_level=raise_level)
             except MatchErrorStack as e:
                 e.push(vtype=self.__class__, val=k)
                 raise
@@ -609,24 +808,55 @@ class _DictMatcher(Value):
 
 
 class _VariantMatcher(Value):
+    __slots__ = ('_name', '_suite', '_options_version',
+                 '_compare_fast_fns', '_compare_fns')
+
     def __init__(self, name):
         self._name = name
         self._suite = None
+        self._options_version = None
+        self._compare_fast_fns = ()
+        self._compare_fns = ()
         
     def _set_suite(self, suite):
         self._suite = suite
+        self._options_version = None
     
     def _variants_referenced(self):
         return set([self._name])
+
+    def _options(self):
+        """
+        Refresh the cached bound compare methods of our options if variants
+        have been added to the suite since they were last looked up.
+        """
+        suite = self._suite
+        if self._options_version != suite._variants_version:
+            options = suite._get_variant_options(self._name)
+            self._compare_fast_fns = tuple(o._compare_fast for o in options)
+            self._compare_fns = tuple(o._compare for o in options)
+            self._options_version = suite._variants_version
     
+    def _compare_fast(self, actual):
+        if self._suite is None:
+            return INCOMPATIBLE
+        self._options()
+        r = INCOMPATIBLE
+        for fn in self._compare_fast_fns:
+            r |= fn(actual)
+        return r
+
     def _compare(self, actual, raise_level=None):
+        if raise_level is None:
+            return self._compare_fast(actual)
         if self._suite is None:
             return INCOMPATIBLE
+        self._options()
         r = INCOMPATIBLE
         match_errors=[]
-        for option in self._suite._get_variant_options(self._name):
+        for fn in self._compare_fns:
             try:
-                r |= option._compare(actual, raise_level=raise_level)
+                r |= fn(actual, raise_level=raise_level)
             except MatchErrorStack as e:
                 match_errors.append(e)
         if match_errors and r < raise_level:
@@ -641,11 +871,14 @@ class Suite(object):
     See Value.match() and Value.valid() for meanings of match and valid
     tests, and the operation of the optional raises keyword argument.
     """
+    __slots__ = ('_requests', '_responses', '_variants', '_variants_version')
     
     def __init__(self):
         self._requests = { }
         self._responses = { }
         self._variants = { }
+        # bumped by _add_variant(), so _VariantMatchers know to refresh
+        self._variants_version = 0
     
     def _add_resource(self, name, request, response):
         request._set_suite(self)
@@ -671,6 +904,7 @@ class Suite(object):
     def _add_variant(self, name, value):
         value._set_suite(self)
         self._variants.setdefault(name, []).append(value)
+        self._variants_version += 1
     
     def _get_variant_options(self, name):
         return self._variants.get(name, [])
@@ -702,6 +936,23 @@ class Suite(object):
     
 
     
+# The simple type matchers have no per-use state, so every parse shares these.
+_TYPEMAP = { 
+        'undef':    _UndefMatcher(),
+        'bool':     _BoolMatcher(),
+        'int':      _IntMatcher(),
+        'real':     _RealMatcher(),
+        'string':   _StringMatcher(),
+        'date':     _DateMatcher(),
+        'uuid':     _UUIDMatcher(),
+        'uri':      _URIMatcher(),
+        'binary':   _BinaryMatcher(),
+        'true':     _TrueMatcher(),
+        'false':    _FalseMatcher()
+    }
+_UNDEF_MATCHER = _TYPEMAP['undef']
+
+
 class ParseError(Exception):
     """
     An error encountered when parsing an LLIDL text.
@@ -723,12 +974,17 @@ class ParseError(Exception):
 
 
 class _Parser(object):
+    __slots__ = ('_string', '_offset', '_line', '_lineoffset')
+
     def __init__(self, input):
         if hasattr(input, "read"):
             self._string = input.read()
             input.close()
         else:
             self._string = input
+        if not isinstance(self._string, StringTypes):
+            raise TypeError("LLIDL input must be a string, not %s"
+                            % type(self._string).__name__)
         self._offset = 0
         self._line = 0
         self._lineoffset = self._offset
@@ -748,10 +1004,9 @@ class _Parser(object):
         return None
         
     def parse_literal(self, lit):
-        n = len(lit)
-        o = self._offset
-        if self._string[o:o+n] == lit:
-            self._offset = o + n
+        # startswith() compares in place, without slicing out a substring
+        if self._string.startswith(lit, self._offset):
+            self._offset += len(lit)
             return lit
         return None
     
@@ -762,16 +1017,20 @@ class _Parser(object):
             return m.group()
         return None
     
-    _ws_re = re.compile(r'(\t| |;[^\n\r]*)*')
-    _nl_re = re.compile(r'\n|\r\n?')
+    # whitespace, comments and newlines, all in one match
+    _s_re = re.compile(r'(?:[\t ]+|;[^\n\r]*|\n|\r\n?)*')
     def parse_s(self):
-        while True:
-            self.parse_re(self._ws_re)
-            if self.parse_re(self._nl_re):
-                self._line += 1
-                self._lineoffset = self._offset
-            else:
-                break
+        start = self._offset
+        end = self._s_re.match(self._string, start).end()
+        if end == start:
+            return
+        self._offset = end
+        skipped = self._string[start:end]
+        # \n, \r and \r\n each end one line
+        lines = skipped.count('\n') + skipped.count('\r') - skipped.count('\r\n')
+        if lines:
+            self._line += lines
+            self._lineoffset = start + max(skipped.rfind('\n'), skipped.rfind('\r')) + 1
         
     _number_re = re.compile(r'\d+')
     def parseNumber(self):
@@ -787,21 +1046,6 @@ class _Parser(object):
             self.error("malformed name: hyphen (-) not allowed")
         return n 
     
-    _typemap = { 
-            'undef':    _UndefMatcher(),
-            'bool':     _BoolMatcher(),
-            'int':      _IntMatcher(),
-            'real':     _RealMatcher(),
-            'string':   _StringMatcher(),
-            'date':     _DateMatcher(),
-            'uuid':     _UUIDMatcher(),
-            'uri':      _URIMatcher(),
-            'binary':   _BinaryMatcher(),
-            'true':     _TrueMatcher(),
-            'false':    _FalseMatcher()
-        }
-    _undefMatcher = _typemap['undef']
-
     def _parse_rest_of_array(self):
         self.parse_s()
         values = []
@@ -857,21 +1101,31 @@ class _Parser(object):
             self.error('empty map')
         return _MapMatcher(members)
     
+    def _parse_rest_of_name(self):
+        name = self.required(self.parseName(), 'expected name in quotes')
+        self.required(self.parse_literal('"'), 'expected close quote')
+        return _NameMatcher(name)
+
+    def _parse_rest_of_variant_ref(self):
+        name = self.required(self.parseName(), 'expected variant name')
+        return _VariantMatcher(name)
+
+    # opening character -> method parsing the rest of that kind of value
+    _value_starts = {
+            '"':    _parse_rest_of_name,
+            '[':    _parse_rest_of_array,
+            '{':    _parse_rest_of_map,
+            '&':    _parse_rest_of_variant_ref,
+        }
+
     def parse_value(self):
-        if self.parse_literal('"'):
-            name = self.required(self.parseName(), 'expected name in quotes')
-            self.required(self.parse_literal('"'), 'expected close quote')
-            return _NameMatcher(name)
-        
-        if self.parse_literal('['):
-            return self._parse_rest_of_array()
-            
-        if self.parse_literal('{'):
-            return self._parse_rest_of_map()
-        
-        if self.parse_literal('&'):
-            name = self.required(self.parseName(), 'expected variant name')
-            return _VariantMatcher(name)
+        # one lookup on the next character, rather than trying each opening
+        # literal in turn
+        offset = self._offset
+        parse_rest = self._value_starts.get(self._string[offset:offset + 1])
+        if parse_rest is not None:
+            self._offset = offset + 1
+            return parse_rest(self)
                 
         number = self.parseNumber()
         if number is not None:
@@ -879,8 +1133,9 @@ class _Parser(object):
             
         type_or_selector = self.parseName()
         if type_or_selector is not None:
-            if type_or_selector in self._typemap:
-                return self._typemap[type_or_selector]
+            matcher = _TYPEMAP.get(type_or_selector)
+            if matcher is not None:
+                return matcher
             self.error('unknown type')
             
         return None
@@ -900,11 +1155,11 @@ class _Parser(object):
 
     def _parse_rest_of_get_resource(self):
         body = self._parse_rest_of_body_resource()
-        return (self._undefMatcher, body)
+        return (_UNDEF_MATCHER, body)
 
     def _parse_rest_of_put_resource(self):
         body = self._parse_rest_of_body_resource()
-        return (body, self._undefMatcher)
+        return (body, _UNDEF_MATCHER)
 
     def _parse_rest_of_getput_resource(self):
         body = self._parse_rest_of_body_resource()
@@ -920,19 +1175,26 @@ class _Parser(object):
         if suite._has_resource(name):
             self.error('duplicate resource name')
         self.parse_s()
-        if self.parse_literal('->'):
-            (req, res) = self._parse_rest_of_post_resource()
-        elif self.parse_literal('<<'):
-            (req, res) = self._parse_rest_of_get_resource()
-        elif self.parse_literal('>>'):
-            (req, res) = self._parse_rest_of_put_resource()
-        elif self.parse_literal('<>'):
-            (req, res) = self._parse_rest_of_getput_resource()
-        elif self.parse_literal('<x>'):
-            (req, res) = self._parse_rest_of_getputdel_resource()
-        else:
+        # every operator is two characters long, but for '<x>'
+        offset = self._offset
+        op = self._string[offset:offset + 2]
+        if op == '<x':
+            op = self._string[offset:offset + 3]
+        parse_rest = self._resource_ops.get(op)
+        if parse_rest is None:
             self.error('unknown resource type, expected ->, <<, >>, <> or <*>')
+        self._offset += len(op)
+        (req, res) = parse_rest(self)
         suite._add_resource(name, req, res)
+
+    # resource operator -> method parsing the rest of that kind of resource
+    _resource_ops = {
+            '->':   _parse_rest_of_post_resource,
+            '<<':   _parse_rest_of_get_resource,
+            '>>':   _parse_rest_of_put_resource,
+            '<>':   _parse_rest_of_getput_resource,
+            '<x>':  _parse_rest_of_getputdel_resource,
+        }
         
 
     def _parse_rest_of_variant(self, suite):
@@ -1,9 +1,10 @@
 from __future__ import absolute_import
 
 from datetime import datetime
-import cgitb
 import json
+from json.encoder import encode_basestring_ascii
 import logging
+import threading
 import time
 import traceback
 
@@ -25,13 +26,38 @@ else:
     # why bother?
     from StringIO import StringIO
 
-try:
-    dict.iteritems
-except AttributeError:
-    # Additional Python 3 compatability. Python 2's dict.iteritems is 3's dict.items
-    iteritems = dict.items
-else:
-    iteritems = dict.iteritems
+# One wire format regardless of what's installed: json's, with sorted keys,
+# non-ASCII escaped, and NaN and infinities as json writes them. Built once,
+# since json.dumps() builds a new encoder per call for non-default options.
+_dumps = json.JSONEncoder(sort_keys=True).encode
+
+# how _dumps() separates items, and keys from values, and escapes strings.
+# Escaping to ASCII also keeps lone surrogates, as in os.fsdecode()d file
+# names, from making the handler's stream fail to encode the line.
+_PLAIN_SEPARATORS = (', ', ': ')
+_encode_str = encode_basestring_ascii
+
+def _plain_template(keys):
+    """
+    A % template producing what _dumps() would for a dict of (sorted) keys,
+    given their already encoded values
+    """
+    item_sep, key_sep = _PLAIN_SEPARATORS
+    return '{' + item_sep.join('"%s"%s%%s' % (k, key_sep) for k in keys) + '}'
+
+_PLAIN_TEMPLATE = _plain_template(('level', 'msg', 'name', 'time'))
+_PLAIN_TEMPLATE_NO_TIME = _plain_template(('level', 'msg', 'name'))
+
+def _dumps_plain(level, msg, name, time=None):
+    """
+    Serialize a record with nothing beyond the base fields, without building
+    a dict for the full encoder to walk. Omit 'time' if time is None.
+    """
+    if time is None:
+        return _PLAIN_TEMPLATE_NO_TIME % (_encode_str(level), _encode_str(msg),
+                                          _encode_str(name))
+    return _PLAIN_TEMPLATE % (_encode_str(level), _encode_str(msg),
+                              _encode_str(name), _encode_str(time))
 
 # This module provides a Python logging formatter that serializes messages into a JSON object suitable for logging to BNW MMA.
 #
@@ -62,16 +88,24 @@ else:
 #         },
 #         # ...
 #     }
+#
+# Pass include_time=False to leave out the 'time' field, e.g. for sinks such as
+# journald that timestamp each entry themselves.
 ################################################################
 
+# JsonFormatter caches its formatted traceback on the record under this key.
+# It's not record.exc_text, because that is what a plain logging.Formatter
+# would then show in place of its own, fuller, traceback.
+_TRACEBACK_CACHE_KEY = '_jsonlog_traceback'
+
 # The uninteresting keys were discovered by dumping what's in a typical LogRecord's __dict__.
 # Ideally we'd have a better way to figure these out, since technically then
 # they could change with Python version. But eh.
-UNINTERESTING_LOGRECORD_KEYS = {
+UNINTERESTING_LOGRECORD_KEYS = frozenset({
     'args', 'created', 'exc_info', 'exc_text', 'filename', 'funcName', 'levelname', 'levelno',
     'lineno', 'module', 'msecs', 'msg', 'name', 'pathname', 'process', 'processName',
-    'relativeCreated', 'stack_info', 'thread', 'threadName',
-}
+    'relativeCreated', 'stack_info', 'thread', 'threadName', _TRACEBACK_CACHE_KEY,
+})
 """Uninteresting data found in a `logging.LogRecord` instance."""
 
 try:
@@ -82,39 +116,78 @@ except NameError:
 
 DOCUMENTED_JSON_TYPES += (dict, list, tuple, int, float, bool, type(None))
 
+# Nearly every extra is exactly one of these types, which a single set lookup
+# finds; only the rest need isinstance() to look for subclasses.
+_DOCUMENTED_JSON_EXACT_TYPES = frozenset(DOCUMENTED_JSON_TYPES + (str, unicode))
+
+
+def _exc_message(exc):
+    """unicode(exc), skipping BaseException.__str__() for a lone text arg"""
+    args = exc.args
+    if (len(args) == 1 and type(args[0]) is unicode
+            and type(exc).__str__ is BaseException.__str__):
+        return args[0]
+    return unicode(exc)
+
+
+def _record_message(record):
+    """
+    record.getMessage(), except that a plain string message without args is
+    already its own result (LogRecord subclasses may override getMessage())
+    """
+    msg = record.msg
+    if not record.args and type(msg) is str and type(record) is logging.LogRecord:
+        return msg
+    return record.getMessage()
+
 
 class JsonFormatter(logging.Formatter):
     """A `logging.Formatter` that formats records as JSON objects."""
 
-    def __init__(self, exception_formatter='traceback'):
+    def __init__(self, exception_formatter='traceback', include_time=True):
         # Format times in GMT
         # https://docs.python.org/2/library/logging.html#formatter-objects
         self.converter = time.gmtime
+        self._exc_formatter = 'cgitb' if exception_formatter == 'cgitb' else 'traceback'
         self._fmt_exc = self._fmt_exc_cgitb if exception_formatter == 'cgitb' else self._fmt_exc_traceback
+        self._include_time = include_time
+        # (whole second, isoformat() of that second) for the last record
+        # formatted: bursts of records usually share a second. A single tuple
+        # so it can't be seen half-updated by another thread.
+        self._time_cache = (None, None)
 
     def format(self, record):
-        data = {
-            'name': record.name,  # logger name
-            'level': record.levelname,
-            'msg': record.getMessage(),
-            'time': self.formatTime(record),
-        }
+        # Include any 'extra' data filtered by a couple predicates, in a single pass.
+        uninteresting = UNINTERESTING_LOGRECORD_KEYS
+        exact_types = _DOCUMENTED_JSON_EXACT_TYPES
+        types = DOCUMENTED_JSON_TYPES
+        extras = {k: v for k, v in record.__dict__.items()
+                  if k not in uninteresting
+                  and (type(v) in exact_types or isinstance(v, types))}
+
+        include_time = self._include_time
+        if not extras and not record.exc_info:
+            # the usual case: just the base fields
+            return _dumps_plain(record.levelname, _record_message(record), record.name,
+                                self.formatTime(record) if include_time else None)
+
+        # Fill in the extras dict we just built rather than allocating
+        # another: setdefault() leaves any extras of the same names in place,
+        # just as updating the fields with the extras used to.
+        data = extras
+        setdefault = data.setdefault
+        setdefault('name', record.name)  # logger name
+        setdefault('level', record.levelname)
+        setdefault('msg', _record_message(record))
+        if include_time:
+            setdefault('time', self.formatTime(record))
         if record.exc_info:
             exc_type, exc, exc_trace = record.exc_info
-            data.update({
-                'error_type': exc_type.__name__,
-                'error_message': unicode(exc),
-                'traceback': self.formatException(record.exc_info),
-            })
+            setdefault('error_type', exc_type.__name__)
+            setdefault('error_message', _exc_message(exc))
+            setdefault('traceback', self._cached_traceback(record))
 
-        # Include any 'extra' data filtered by a couple predicates. Generators are chained together
-        # before enumeration to avoid extra work.
-        items = iteritems(record.__dict__)
-        items = ((k, v) for k, v in items if k not in UNINTERESTING_LOGRECORD_KEYS)
-        items = ((k, v) for k, v in items if isinstance(v, DOCUMENTED_JSON_TYPES))
-        data.update(items)
-
-        return json.dumps(data, sort_keys=True)
+        return _dumps(data)
 
     def formatTime(self, record, datefmt=None):
         if datefmt:
@@ -126,25 +199,70 @@ class JsonFormatter(logging.Formatter):
             # If caller did not pass datefmt, use datetime.isoformat() to
             # include microseconds, which time.strftime() cannot support
             # because time.struct_time() has no field for fractional seconds.
-            return datetime.fromtimestamp(record.created).isoformat() + 'Z'
+            # Only the microseconds change between records in the same
+            # second, so reuse the rest from the last record.
+            created = record.created
+            sec = int(created)
+            # rounded the way datetime.fromtimestamp() does
+            usec = int(round((created - sec) * 1e6))
+            if usec >= 1000000 or usec < 0:
+                # rounds into another second: leave it to datetime
+                return datetime.fromtimestamp(created).isoformat() + 'Z'
+            last_sec, prefix = self._time_cache
+            if sec != last_sec:
+                prefix = datetime.fromtimestamp(sec).isoformat()
+                self._time_cache = (sec, prefix)
+            if usec:
+                return '%s.%06dZ' % (prefix, usec)
+            # isoformat() omits zero microseconds
+            return prefix + 'Z'
 
     def formatException(self, exc_info):
         return self._fmt_exc(exc_info)
 
+    def _cached_traceback(self, record):
+        # When several handlers format the same record, format its traceback
+        # only once per exception formatter, as logging.Formatter does with
+        # record.exc_text. The cache is keyed by the formatter's name rather
+        # than its function so the record stays picklable for SocketHandler.
+        name, text = getattr(record, _TRACEBACK_CACHE_KEY, (None, None))
+        if name != self._exc_formatter:
+            text = self.formatException(record.exc_info)
+            setattr(record, _TRACEBACK_CACHE_KEY, (self._exc_formatter, text))
+        return text
+
     @staticmethod
     def _fmt_exc_traceback(exc_info):
         _, _, exc_trace = exc_info
         return ''.join(traceback.format_tb(exc_trace, 10))
 
+    # per-thread (StringIO, cgitb.Hook) reused by _fmt_exc_cgitb()
+    _cgitb_local = threading.local()
+
     @staticmethod
     def _fmt_exc_cgitb(exc_info):
         # cgitb.Hook writes its output to the file-like object provided to its
-        # constructor. As we don't want to accumulate successive formatted
-        # exceptions, we need a new StringIO instance every time. (There is no
-        # method to clear a StringIO instance.) But as there is also no method
-        # to replace the stream used by a Hook instance, we must therefore
-        # instantiate a new Hook every time.
-        stream = StringIO()
-        hook = cgitb.Hook(file=stream, format='text')
-        hook.handle(exc_info)
-        return stream.getvalue()
+        # constructor. Rather than build a new StringIO and Hook for every
+        # exception, each thread keeps one of each, emptying the StringIO
+        # before each use so successive formatted exceptions don't accumulate.
+        # While in use they're taken out of the thread's slot: cgitb repr()s
+        # the traceback's locals, and a repr() that itself logs an exception
+        # must get fresh ones rather than clobber ours.
+        local = JsonFormatter._cgitb_local
+        writer = getattr(local, 'writer', None)
+        if writer is None:
+            # cgitb pulls in inspect, pydoc and more, so only import it once
+            # someone actually asks for its output
+            import cgitb
+            stream = StringIO()
+            hook = cgitb.Hook(file=stream, format='text')
+        else:
+            local.writer = None
+            stream, hook = writer
+            stream.seek(0)
+            stream.truncate()
+        try:
+            hook.handle(exc_info)
+            return stream.getvalue()
+        finally:
+            local.writer = (stream, hook)
@@ -1,7 +1,6 @@
 from contextlib import contextmanager
+from itertools import chain
 import json
-import llsd
-import os
 from pprint import pformat
 import requests
 import ssl
@@ -14,7 +13,6 @@ except ImportError:
     from urlparse import urlsplit, urlunsplit, SplitResult
     import cookielib as cookiejar
 from urllib3 import poolmanager
-from xml.etree import cElementTree as ElementTree
 
 try:
     unicode
@@ -29,6 +27,53 @@ except NameError:
     # Python 3
     user_input = input
 
+try:
+    # orjson is optional, and much faster than json when it's installed
+    import orjson
+except ImportError:
+    orjson = None
+
+# Always json: a request body must be the same type, and spell the same
+# values (NaN, non-ASCII), whether or not orjson is installed. Compact, since
+# nobody reads request bodies but servers, and built once, since json.dumps()
+# builds a new encoder per call for non-default options. Non-ASCII is still
+# escaped: requests sends a str body encoded as latin-1.
+_json_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+if orjson is not None:
+    def _json_decode(response):
+        try:
+            return orjson.loads(response.content)
+        except ValueError:
+            # orjson only reads UTF-8, and rejects NaN; requests also detects
+            # UTF-16 and UTF-32 bodies. Let it try, and report its error if
+            # it fails.
+            return response.json()
+else:
+    def _json_decode(response):
+        return response.json() # use decoding in requests
+
+# how much of a streamed response body to read at a time
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+# response statuses that never have a body
+_NO_BODY_STATUSES = frozenset((204, 205, 304))
+
+# error response bodies bigger than this aren't worth decoding in full for
+# the RESTError message
+_ERROR_BODY_LIMIT = 4096
+
+def _body_text(response, content):
+    """
+    Return content, some or all of response's body, as text for an error
+    message. Never fails: bytes that don't decode are replaced.
+    """
+    try:
+        return content.decode(response.encoding or 'utf-8', 'replace')
+    except LookupError:
+        # the response claims a charset Python doesn't know
+        return content.decode('utf-8', 'replace')
+
 class RESTError(Exception):
     """
     Describes an error from a RESTService request
@@ -51,10 +96,9 @@ class RESTError(Exception):
         to {url} or {status} or any additional keyword argument passed to our
         constructor.
         """
-        # When you first enter a function, locals() contains only its args.
-        variables = locals().copy()
-        # Allow caller to supplement name references with whatever s/he wants.
-        variables.update(kwds)
+        # Allow caller to supplement name references with whatever s/he
+        # wants. (They can't collide with our named parameters.)
+        variables = dict(kwds, service=service, url=url, status=status, msg=msg)
         self.service = service
         self.url = url
         self.status = status
@@ -83,11 +127,18 @@ class RESTEncodingBase(object):
         # reliably report the name of either. This is that method.
         return cls.__name__
 
+    # A codec that sets streaming = True can parse a response body as it
+    # arrives, and must implement decode_chunks().
+    streaming = False
+
     def set_accept_header(self, session): # session is the requests.Session object
         raise NotImplementedError
     def decode(self, response): # response is the requests.response object
         """Given invalid input, this should raise ValueError"""
         raise NotImplementedError
+    def decode_chunks(self, chunks): # chunks iterates over the body as bytes
+        """Given invalid input, this should raise ValueError"""
+        raise NotImplementedError
     def set_content_type_header(self, session):
         # need not override this method if this codec needs no Content-Type header
         pass
@@ -96,12 +147,15 @@ class RESTEncodingBase(object):
 
 class RESTEncoding(object):
     """Classes that define the encoding/decoding for a RESTService"""
+    # Each codec imports the parser it needs only when first used, so that a
+    # script using one codec doesn't pay to load the others' parsers.
     class LLSD(RESTEncodingBase):
         def set_accept_header(self, session):
             # for most SL services, llsd is the default and we don't use a mime type to select it
             session.headers['Accept'] = '*/*'
 
         def decode(self, response):
+            import llsd
             try:
                 return llsd.parse(response.content)
             except llsd.LLSDParseError as err:
@@ -115,6 +169,7 @@ class RESTEncoding(object):
             # If a particular REST API requires you to POST xml+llsd,
             # introduce an LLSDXML codec for the purpose... otherwise, use
             # notation.
+            import llsd
             return llsd.format_notation(data)
 
     class LLSDXML(LLSD):
@@ -134,6 +189,7 @@ class RESTEncoding(object):
             session.headers['Content-Type'] = 'application/llsd+xml'
 
         def encode(self, data):
+            import llsd
             return llsd.format_xml(data)
 
     class JSON(RESTEncodingBase):
@@ -142,7 +198,7 @@ class RESTEncoding(object):
 
         def decode(self, response):
             try:
-                return response.json() # use decoding in requests
+                return _json_decode(response)
             except ValueError as err:
                 raise ValueError("%s: failed to parse response as json: %s"
                                  % (self.__class__.__name__, err))
@@ -151,23 +207,40 @@ class RESTEncoding(object):
             session.headers['Content-Type'] = 'application/json'
 
         def encode(self, data):
-            return json.dumps(data)
+            return _json_encode(data)
 
     class XML(RESTEncodingBase):
+        streaming = True
+
         def set_accept_header(self, session):
             session.headers['Accept'] = 'application/xml'
 
         def decode(self, response):
+            from xml.etree import cElementTree as ElementTree
             try:
                 return ElementTree.fromstring(response.content)
             except Exception as err:
                 raise ValueError("%s: %s parsing response as XML: %s"
                                  % (self.__class__.__name__, err.__class__.__name__, err))
 
+        def decode_chunks(self, chunks):
+            from xml.etree import cElementTree as ElementTree
+            # feed the parser as the body arrives, never holding all of it
+            parser = ElementTree.XMLParser()
+            try:
+                for chunk in chunks:
+                    parser.feed(chunk)
+                return parser.close()
+            # (anything else is trouble reading the chunks, not parsing them)
+            except ElementTree.ParseError as err:
+                raise ValueError("%s: %s parsing response as XML: %s"
+                                 % (self.__class__.__name__, err.__class__.__name__, err))
+
         def set_content_type_header(self, session):
             session.headers['Content-Type'] = 'application/xml'
 
         def encode(self, data):
+            from xml.etree import cElementTree as ElementTree
             return ElementTree.tostring(data)
 
 class _RESTService(object):
@@ -210,11 +283,11 @@ class _RESTService(object):
     # describe __init__() params; used by _resolve_args()
     init_params = ('name', 'baseurl', 'codec', 'authenticated',
                    'username', 'password', 'proxy_hostport', 'cert', 'basepath',
-                   'cookie_policy')
+                   'cookie_policy', 'pool_size')
 
     def __init__(self, name, baseurl, codec=RESTEncoding.LLSD, authenticated=True,
                  username=None, password=None, proxy_hostport=None, cert=None, basepath='',
-                 cookie_policy=None, **session_params):
+                 cookie_policy=None, pool_size=32, **session_params):
         """
         Parameters:
         name:            used in generating error messages
@@ -234,6 +307,10 @@ class _RESTService(object):
         cookie_policy:   http.cookiejar.CookiePolicy subclass for the session
                          https://docs.python.org/3/library/http.cookiejar.html#http.cookiejar.CookiePolicy
                          Special value cookie_policy=False blocks all cookies.
+        pool_size:       how many connections to keep alive per host, and how
+                         many hosts to keep pools for, so that threads
+                         sharing this service reuse connections rather than
+                         churning them
 
         Any other keyword parameters are passed through to the requests.Session() 
         """
@@ -247,13 +324,27 @@ class _RESTService(object):
 
         self.session_params = session_params
         self.session = requests.Session(**session_params)
+        self.pool_size = pool_size
+        adapter = self._adapter(requests.adapters.HTTPAdapter)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.codec = None               # set_codec() returns previous self.codec
         self.set_codec(codec)
 
         self.proxy_hostport = proxy_hostport
-        self.session.proxies = { 'http': 'http://%s' % proxy_hostport,
-                                 'https':'http://%s' % proxy_hostport } \
-            if proxy_hostport else None
+        if proxy_hostport:
+            proxy = 'http://%s' % proxy_hostport
+            self.session.proxies = { 'http': proxy, 'https': proxy }
+        else:
+            self.session.proxies = None
+        # The requests library lets proxy settings in the environment
+        # override the session's proxies, so any proxy_hostport would be
+        # IGNORED if, say, http_proxy were set. A request's own proxies do
+        # take precedence, so pass a copy of these with each request: a copy,
+        # because requests fills the environment's other proxies into the
+        # dict it's passed, and those depend on each request's URL (see
+        # no_proxy). Without a proxy_hostport, http_proxy is still ignored.
+        self._proxies = dict(self.session.proxies or {'http': None})
         if cert:
             self.session.cert = cert
         if cookie_policy is not None:
@@ -273,26 +364,38 @@ class _RESTService(object):
         self.username = username
         self.password = password
 
-    def clone(self, **kwds):
+    def clone(self, share_pool=False, **kwds):
         """
         Return a RESTService instance configured the same as self, but with a
         different requests.Session instance for concurrent queries.
 
         Any constructor parameters can optionally be overridden for the new
         instance.
+
+        Pass share_pool=True for the new instance to use self's connection
+        pools rather than its own (and so self's pool_size, and TLS settings
+        from enable_old_tls()). Each Session keeps its own cookies and
+        headers, but a connection either one has made can serve both.
+        Closing either Session closes the pools' idle connections.
         """
         # Start with the relevant state from self
         newkwds = dict(name=self.name, baseurl=self.baseurl, codec=self.codec,
                        authenticated=self.authenticated,
                        username=self.username, password=self.password,
                        proxy_hostport=self.proxy_hostport,
-                       cert=self.session.cert, **self.session_params)
+                       cert=self.session.cert, pool_size=self.pool_size,
+                       **self.session_params)
         # then apply any overrides from parameters
         newkwds.update(kwds)
         # Allow for the possibility that we might actually be dealing with a
         # subclass -- which constrains subclasses to accept constructor params
         # just like our own.
-        return self.__class__(**newkwds)
+        clone = self.__class__(**newkwds)
+        if share_pool:
+            # HTTPAdapter's pools are thread-safe, unlike a Session
+            for prefix in ('http://', 'https://'):
+                clone.session.mount(prefix, self.session.get_adapter(prefix))
+        return clone
 
     def set_username(self, username):
         """Associate a username with the service; subsequent query calls to the service will use this"""
@@ -343,7 +446,15 @@ class _RESTService(object):
         1.1. But sometimes we must contact one of our own older services. This
         workaround is from https://github.com/psf/requests/issues/4775.
         """
-        self.session.mount('https://', _OldTLS())
+        self.session.mount('https://', self._adapter(_OldTLS))
+
+    def _adapter(self, adapter_class):
+        """
+        Return an instance of the passed HTTPAdapter subclass with our
+        connection pool sizes.
+        """
+        return adapter_class(pool_connections=self.pool_size,
+                             pool_maxsize=self.pool_size)
 
     def _url(self, basepath, path, method, path_param='path', basepath_param='basepath'):
         """
@@ -373,11 +484,23 @@ class _RESTService(object):
             
             # perhaps oddly, this split/unsplit dodge works even if baseurl is
             # the empty string
-            baseurl = urlunsplit(urlsplit(unicode(baseurl))._replace(path=unicode(basepath)))
+            split_baseurl, split = self._split_baseurl
+            if split_baseurl != baseurl:
+                # only split baseurl again if someone has changed it
+                split = urlsplit(unicode(baseurl))
+                self._split_baseurl = (baseurl, split)
+            baseurl = urlunsplit(split._replace(path=unicode(basepath)))
 
         # Use whichever of baseurl and path isn't empty. If they're both
         # present, join them with '/'
-        return '/'.join(filter(None, (baseurl, path)))
+        if not path:
+            return baseurl
+        if not baseurl:
+            return path
+        return baseurl + '/' + path
+
+    # (baseurl, urlsplit() of it) as last used by _url()
+    _split_baseurl = (None, None)
 
     def get(self, query=None, params={}, basepath=None, **requests_params):
         """ Execute a GET request query against the service
@@ -398,12 +521,15 @@ class _RESTService(object):
         """
         # Execute the request and deal with any connection or server errors
         url=self._url(basepath, query, method='get', path_param='query')
+        if 'proxies' not in requests_params:
+            requests_params['proxies'] = dict(self._proxies)
+        streamed = self._stream(requests_params)
         with self._error_handling(url):
             response = self.session.get(url, auth=self._get_credentials(), params=params, **requests_params)
             response.raise_for_status() # turns any error response into an exception
 
         # Request returned success code, so decode the body per the service configuration
-        return self._decode(response)
+        return self._decode(response, streamed)
 
     def post(self, path=None, data={}, basepath=None, **requests_params):
         """
@@ -423,13 +549,16 @@ class _RESTService(object):
         Any other keyword arguments are passed through to requests.post
         """
         url = self._url(basepath, path, method='post')
+        if 'proxies' not in requests_params:
+            requests_params['proxies'] = dict(self._proxies)
+        streamed = self._stream(requests_params)
         with self._error_handling(url):
             response = self.session.post(url, data=self._encode(url, data),
                                          auth=self._get_credentials(), **requests_params)
             response.raise_for_status()
 
         # decode the response body, if any
-        return self._decode(response)
+        return self._decode(response, streamed)
 
     def put(self, path=None, data={}, basepath=None, **requests_params):
         """
@@ -449,13 +578,16 @@ class _RESTService(object):
         Any other keyword arguments are passed through to requests.put
         """
         url = self._url(basepath, path, method='put')
+        if 'proxies' not in requests_params:
+            requests_params['proxies'] = dict(self._proxies)
+        streamed = self._stream(requests_params)
         with self._error_handling(url):
             response = self.session.put(url, data=self._encode(url, data),
                                         auth=self._get_credentials(), **requests_params)
             response.raise_for_status()
 
         # decode the response body, if any
-        return self._decode(response)
+        return self._decode(response, streamed)
 
     def delete(self, path=None, basepath=None, **requests_params):
         """
@@ -470,45 +602,98 @@ class _RESTService(object):
         Any other keyword arguments are passed through to requests.delete
         """
         url = self._url(basepath, path, method='delete')
+        if 'proxies' not in requests_params:
+            requests_params['proxies'] = dict(self._proxies)
+        streamed = self._stream(requests_params)
         with self._error_handling(url):
             response = self.session.delete(url, auth=self._get_credentials(),
                                            **requests_params)
             response.raise_for_status()
 
         # decode the response body, if any
-        return self._decode(response)
+        return self._decode(response, streamed)
 
     def _encode(self, url, data):
         try:
-            return self.codec.encode(data)
+            return self._encode_fn(data)
         except Exception as err:
             raise RESTError(self.name, url, '000',
                             '{err.__class__.__name__} while {codec} encoding data: {err}\n'
-                            '  for url: {url}', err=err, codec=self.codec.name())
+                            '  for url: {url}', err=err, codec=self._codec_name)
+
+    def _stream(self, requests_params):
+        """
+        If our codec can parse a body as it arrives, and our caller has not
+        said whether to stream, ask requests to leave the body unread for
+        _decode(). Return True if so.
+        """
+        if self.codec.streaming and 'stream' not in requests_params:
+            requests_params['stream'] = True
+            return True
+        return False
+
+    def _decode(self, response, streamed=False):
+        if streamed:
+            return self._decode_stream(response)
 
-    def _decode(self, response):
         # Don't bother passing an empty response body -- expected for most
         # operations -- to our codec.
         if not response.content:
             return ""
 
         try:
-            return self.codec.decode(response)
+            return self._decode_fn(response)
         except Exception as err:
-            text = response.text
-            # Sometimes, as when we inadvertently reach a Google
-            # authentication page, instead of (say) JSON we get a whole ton of
-            # CSS + HTML. Building all that into the exception message doesn't
-            # actually clarify the nature of the problem.
-            limit = 512
-            if len(text) > limit:
-                text = text[:limit] + "..."
-            raise RESTError(self.name, response.request.url, response.status_code,
-                            '{err.__class__.__name__} while {codec} decoding response from url "{url}":\n'
-                            '{err}\n'
-                            'response data:\n'
-                            '{text}', err=err, codec=self.codec.name(),
-                            text=text)
+            self._decode_error(response, err, response.text)
+
+    def _decode_stream(self, response):
+        """
+        _decode() for a response whose body has been left unread: feed it to
+        our codec a chunk at a time.
+        """
+        url = response.request.url
+        try:
+            # When the headers say there's no body, don't go reading one.
+            if (response.status_code in _NO_BODY_STATUSES
+                    or response.headers.get('Content-Length') == '0'):
+                return ""
+            # reading the body can still fail at the HTTP level
+            with self._error_handling(url):
+                chunks = response.iter_content(_STREAM_CHUNK_SIZE)
+                first = next(chunks, b'')
+                # As with _decode(), don't pass an empty body to our codec.
+                if not first:
+                    return ""
+                try:
+                    return self.codec.decode_chunks(chain((first,), chunks))
+                except (RESTError, requests.RequestException):
+                    raise
+                except Exception as err:
+                    # the rest of the body is gone, but the first chunk will
+                    # do to show what we got
+                    self._decode_error(response, err, _body_text(response, first))
+        finally:
+            # return the connection to the pool, even if we stopped reading
+            response.close()
+
+    def _decode_error(self, response, err, text):
+        """
+        Raise RESTError for a failure to decode response, showing the start
+        of its body text.
+        """
+        # Sometimes, as when we inadvertently reach a Google
+        # authentication page, instead of (say) JSON we get a whole ton of
+        # CSS + HTML. Building all that into the exception message doesn't
+        # actually clarify the nature of the problem.
+        limit = 512
+        if len(text) > limit:
+            text = text[:limit] + "..."
+        raise RESTError(self.name, response.request.url, response.status_code,
+                        '{err.__class__.__name__} while {codec} decoding response from url "{url}":\n'
+                        '{err}\n'
+                        'response data:\n'
+                        '{text}', err=err, codec=self._codec_name,
+                        text=text)
 
     @contextmanager
     def _error_handling(self, url):
@@ -516,9 +701,8 @@ class _RESTService(object):
         For internal use; unifies mapping requests.RequestException to RESTError.
         """
         try:
-            with self._hide_http_proxy():
-                # execute the body of the 'with' statement
-                yield
+            # execute the body of the 'with' statement
+            yield
         except requests.exceptions.HTTPError as err:
             if err.response.status_code == 404:
                 self.RESTError_from_exc(url, err,
@@ -537,31 +721,13 @@ class _RESTService(object):
                                     "{err.__class__.__name__}: {err}\n"
                                     "  for url: {url}")
 
-    @staticmethod
-    @contextmanager
-    def _hide_http_proxy():
-        """
-        The requests library is sensitive to the presence of http_proxy in the
-        environment. In fact, if http_proxy is visible to requests, any
-        proxy_hostport passed to __init__() is IGNORED. This context manager
-        temporarily hides http_proxy during the body of its 'with' statement.
-        """
-        # Remove http_proxy, if any, from this process's environment
-        http_proxy = os.environ.pop('http_proxy', None)
-        try:
-            # execute body of 'with' statement
-            yield
-        finally:
-            # restore http_proxy, if it was present to begin with
-            if http_proxy is not None:
-                os.environ['http_proxy'] = http_proxy
-
     def RESTError_from_exc(self, url, err, msg, **kwds):
         """
         Return a RESTError instance populated with self.name, the passed url
         and the status from the RequestException passed as err. Also, if there
         is a response and its body is non-empty, append the (decoded) response
-        body to the message.
+        body to the message: or, if it's bigger than _ERROR_BODY_LIMIT, the
+        start of its text.
         """
         # First, make sure the exception is available for message formatting.
         kwds['err'] = err
@@ -578,22 +744,30 @@ class _RESTService(object):
             status = getattr(response, 'status_code', '000')
 
             # only if there's a non-empty content attribute
-            if getattr(response, 'content', None):
-                # The response body may or may not be encoded as we expect. Try
-                # decoding it -- but in this case, a decode failure isn't an error.
-                try:
-                    decoded = self.codec.decode(response)
-                except Exception:
-                    # We don't care why it failed -- means it's not encoded as we
-                    # expected. The likely meaning is that the message is simply
-                    # formatted for a human reader instead of as JSON or whatever. In
-                    # any case, append non-empty response text.
-                    _text = response.text
+            content = getattr(response, 'content', None)
+            if content:
+                if len(content) > _ERROR_BODY_LIMIT:
+                    # Parsing and pretty-printing all of a big body (an HTML
+                    # error page, say) costs far more than the rest of the
+                    # error handling, for a message nobody reads to the end.
+                    # Just show its start.
+                    _text = _body_text(response, content[:_ERROR_BODY_LIMIT]) + "..."
                 else:
-                    # Here we WERE able to decode the response, meaning it's probably
-                    # structured Python data in some form. Use pformat() to aid
-                    # human readability.
-                    _text = pformat(decoded)
+                    # The response body may or may not be encoded as we expect. Try
+                    # decoding it -- but in this case, a decode failure isn't an error.
+                    try:
+                        decoded = self.codec.decode(response)
+                    except Exception:
+                        # We don't care why it failed -- means it's not encoded as we
+                        # expected. The likely meaning is that the message is simply
+                        # formatted for a human reader instead of as JSON or whatever. In
+                        # any case, append non-empty response text.
+                        _text = response.text
+                    else:
+                        # Here we WERE able to decode the response, meaning it's probably
+                        # structured Python data in some form. Use pformat() to aid
+                        # human readability.
+                        _text = pformat(decoded)
 
                 # Either way, append {_text} to the original message, and add
                 # _text to the available keywords. We do it this way instead
@@ -612,6 +786,9 @@ class _RESTService(object):
         Some services use different encodings for different operations. This
         method sets a new codec for all subsequent operations. It returns the
         previous codec.
+
+        Prefer set_codec() or temp_codec() to assigning self.codec: only they
+        update the session's Accept and Content-Type headers.
         """
         old = self.codec
         # Our parameter could be a codec class, in which case we must
@@ -623,6 +800,22 @@ class _RESTService(object):
         self.codec.set_content_type_header(self.session)
         return old
 
+    @property
+    def codec(self):
+        return self._codec
+
+    @codec.setter
+    def codec(self, codec):
+        self._codec = codec
+        # what each request needs from the codec, looked up once here rather
+        # than on every request
+        if codec is None:
+            self._encode_fn = self._decode_fn = self._codec_name = None
+        else:
+            self._encode_fn = codec.encode
+            self._decode_fn = codec.decode
+            self._codec_name = codec.name()
+
     @contextmanager
     def temp_codec(self, codec):
         """
@@ -747,6 +940,11 @@ def delete(url, **kwds):
     svc, kwds = _resolve_args('delete', url, kwds)
     return svc.delete(path='', basepath='', **kwds)
 
+# _RESTService.init_params includes the first two parameters, name and
+# baseurl, to simplify maintenance. But since _resolve_args() passes those
+# explicitly, remove them from the set of keywords it recognizes.
+_INIT_PARAMS = frozenset(_RESTService.init_params[2:])
+
 def _resolve_args(func, url, kwds):
     """
     Given a dict of **kwds, split them into _RESTService constructor params
@@ -755,14 +953,10 @@ def _resolve_args(func, url, kwds):
 
     Return (_RESTService instance, remaining kwds).
     """
-    # _RESTService.init_params includes the first two parameters, name and
-    # baseurl, to simplify maintenance. But since we pass those explicitly
-    # here, remove from the set of keywords we recognize.
-    init_params = set(_RESTService.init_params[2:])
     init_kwds = {}
     func_kwds = {}
     for key, value in kwds.items():
-        if key in init_params:
+        if key in _INIT_PARAMS:
             dest_kwds = init_kwds
         else:
             dest_kwds = func_kwds
@@ -192,6 +192,37 @@ class ConfigInstanceTester(unittest.TestCase):
 
         self._config.as_dict()
 
+    def testUpdateFileTwice(self):
+        """
+        Test that updating from an unchanged file reuses the previous parse.
+        """
+        self._config.update(r"./tests/config_update.xml")
+        self._config.set('scale', 'setValue')
+
+        with mock.patch('llbase.config._parse_file') as parse:
+            self._config.update(r"./tests/config_update.xml")
+            self.assertFalse(parse.called)
+
+        self.assertEqual('updateValue', self._config.get('scale'))
+        self.assertEqual(888, self._config.get('id'))
+
+    def testUpdateFileTwiceAfterModifying(self):
+        """
+        Test that modifying a nested value from an updated file doesn't
+        change what a second update from the unchanged file applies.
+        """
+        fd, path = tempfile.mkstemp(suffix='.xml')
+        try:
+            with os.fdopen(fd, 'wb') as update_file:
+                update_file.write(llsd.format_xml({'stats': {'fps': 44}}))
+            self._config.update(path)
+            self._config.get('stats')['fps'] = 0
+            self._config.update(path)
+        finally:
+            os.remove(path)
+
+        self.assertEqual(44, self._config.get('stats')['fps'])
+
     def testUpdateWithNonExistentFile(self):
         """
         Test update with non existent file.
@@ -417,6 +448,31 @@ class ConfigInstanceTester(unittest.TestCase):
 
         self.assertEqual("v1", config.get("k1"))
 
+    def testAsDictIsCopy(self):
+        """
+        Test that modifying the result of as_dict() doesn't affect the
+        config.
+        """
+        d = self._config.as_dict()
+        self.assertEqual('one minute', d['scale'])
+        d['simulator statistics']['sim fps'] = 0.0
+        d['scale'] = 'changed'
+
+        self.assertEqual('one minute', self._config.get('scale'))
+        self.assertEqual(44.38898,
+                         self._config.get('simulator statistics')['sim fps'])
+
+    @unittest.skipIf(config.MappingProxyType is None,
+                     "no read-only view: as_dict(readonly=True) copies")
+    def testAsDictReadonly(self):
+        """
+        Test that as_dict(readonly=True) can't be used to change the config.
+        """
+        d = self._config.as_dict(readonly=True)
+        self.assertEqual('one minute', d['scale'])
+        with self.assertRaises(TypeError):
+            d['scale'] = 'changed'
+        self.assertEqual('one minute', self._config.get('scale'))
 
     def testUpdateFilelike(self):
         """
@@ -431,6 +487,17 @@ class ConfigInstanceTester(unittest.TestCase):
         self.assertEqual('new_value', self._config.get('k1'))
         self.assertEqual('v3', self._config.get('k3'))
 
+    def testUpdateParserAttributeError(self):
+        """
+        Test that an AttributeError raised while parsing isn't mistaken
+        for an llsd that can't read streams.
+        """
+        with mock.patch('llbase.config._PARSE_STREAMS', True), \
+             mock.patch('llbase.llsd.parse', side_effect=AttributeError('bug')) as parse:
+            self.assertRaises(AttributeError, self._config.update,
+                              BytesIO(llsd.format_xml({'k1': 'v1'})))
+            self.assertEqual(1, parse.call_count)
+
 class ConfigInstanceFileTester(unittest.TestCase):
     """
     This class aggregate tests for realoading config files.
@@ -480,13 +547,54 @@ class ConfigInstanceFileTester(unittest.TestCase):
         self.conf._last_mod_time
         os.utime(self.filename, (now + 10, now + 10))
 
-        mock_time = mock.Mock(return_value=now + 60) # 60 seconds into future
-        @mock.patch('time.time', mock_time)
+        # 60 seconds into future
+        mock_time = mock.Mock(return_value=config._monotonic() + 60)
+        @mock.patch('llbase.config._monotonic', mock_time)
         def _check_reload(self):
             self.assertEqual('new value', self.conf.get('k1'))
             self.assertEqual('v2', self.conf.get('k2'))
         _check_reload(self)
 
+    def testReloadIntervalChanged(self):
+        """
+        Test that a check interval changed after loading takes effect at
+        the next check.
+        """
+        self.conf._reload_check_interval = 0
+
+        now = time.time()
+
+        self.writeConf({'k1':'new value', 'k2':'v2'})
+        os.utime(self.filename, (now + 10, now + 10))
+
+        # 1 second into future: well within the default interval
+        mock_time = mock.Mock(return_value=config._monotonic() + 1)
+        @mock.patch('llbase.config._monotonic', mock_time)
+        def _check_reload(self):
+            self.assertEqual('new value', self.conf.get('k1'))
+        _check_reload(self)
+
+    def testReloadKeepsOverrides(self):
+        """
+        Test that reloading keeps runtime overrides and drops keys removed
+        from the file.
+        """
+        self.conf.set('k1', 'override')
+
+        now = time.time()
+
+        self.writeConf({'k1':'new value', 'k3':'v3'})
+        os.utime(self.filename, (now + 10, now + 10))
+
+        # 60 seconds into future
+        mock_time = mock.Mock(return_value=config._monotonic() + 60)
+        @mock.patch('llbase.config._monotonic', mock_time)
+        def _check_reload(self):
+            self.assertEqual('override', self.conf.get('k1'))
+            self.assertEqual(None, self.conf.get('k2'))
+            self.assertEqual('v3', self.conf.get('k3'))
+        _check_reload(self)
+
 
 class ConfigStressTest(unittest.TestCase):
     """
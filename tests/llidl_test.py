@@ -2,8 +2,10 @@
 Test the llidl module
 """
 
+import copy
 import datetime
 import io
+import pickle
 import unittest
 
 from llbase import llidl
@@ -255,6 +257,32 @@ class LLIDLTypeTests(unittest.TestCase):
         self.assertTrue(v.incompatible(_uri()))
         self.assertTrue(v.match(_binary()))
 
+    def testLongStringsNotRemembered(self):
+        """
+        Test that the shared matchers remember results for short strings
+        only, but judge long ones just the same.
+        """
+        v = llidl.parse_value("int")
+        memo = llidl._TYPEMAP['int']._memo
+        # still fits an int, not a long, on Python 2
+        long_number = '0' * llidl._MEMO_MAX_LEN + '1'
+
+        self.assertTrue(v.match(long_number))
+        self.assertTrue(v.match(long_number))
+        self.assertFalse(long_number in memo)
+        self.assertTrue(v.match('12'))
+        self.assertTrue('12' in memo)
+
+    def testCompoundMatchersSlotted(self):
+        """
+        Test that compound and variant matchers carry no per-instance dict.
+        """
+        suite = llidl.parse_suite("&v = int %% foo << [ { a: &v }, { $: string } ]")
+        array = suite._responses['foo']
+        for matcher in (array, array._values[0], array._values[0]._members['a'],
+                        array._values[1]):
+            self.assertFalse(hasattr(matcher, '__dict__'), matcher)
+
 class LLIDLSelectorTests(unittest.TestCase):
     """
     This class aggregates all the test cases for atomic type selectors.
@@ -1855,7 +1883,21 @@ class LLIDLSuiteTests(unittest.TestCase):
             suite.valid_response('object/info',
                 { 'name': 'blob', 'pos': p, 'geom':
                     { 'type': 'mesh', 'verticies': [ 1, 2, 3, 4 ] } }))
-        
+
+    def test_variant_added_after_match(self):
+        suite = llidl.parse_suite(""";variant suite
+%% object/info
+-> undef
+<- { geom: &geometry }
+
+&geometry = { type: "sphere", radius: real }
+""")
+        mesh = { 'geom': { 'type': 'mesh', 'faces': 3 } }
+        self.assertFalse(suite.valid_response('object/info', mesh))
+        suite._add_variant('geometry',
+            llidl.parse_value('{ type: "mesh", faces: int }'))
+        self.assertTrue(suite.valid_response('object/info', mesh))
+
 
 class LLIDLExceptionTests(unittest.TestCase):
     def test_value_exceptions(self):
@@ -1907,6 +1949,31 @@ class LLIDLExceptionTests(unittest.TestCase):
             self.assertEqual(str(me),
                 "Resource name 'some_api' not found in suite.")
             
+class LLIDLResultTests(unittest.TestCase):
+    """
+    This class aggregates tests of the match result constants.
+    """
+    RESULTS = (llidl.MATCHED, llidl.CONVERTED, llidl.DEFAULTED,
+               llidl.ADDITIONAL, llidl.MIXED, llidl.INCOMPATIBLE)
+
+    def testCopy(self):
+        """
+        Test that copies of a result are equal to the original.
+        """
+        for result in self.RESULTS:
+            self.assertEqual(result, copy.copy(result))
+            self.assertEqual(result, copy.deepcopy(result))
+            self.assertEqual([result], copy.deepcopy([result]))
+
+    def testPickle(self):
+        """
+        Test that unpickled results are equal to the original.
+        """
+        for result in self.RESULTS:
+            for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+                self.assertEqual(result,
+                                 pickle.loads(pickle.dumps(result, protocol)))
+
 class LLIDLReportingTests(unittest.TestCase):
     __test__ = False
     def x_test_detail(self):
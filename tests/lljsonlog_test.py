@@ -1,10 +1,14 @@
 from __future__ import print_function
 
+from datetime import datetime
 import json
 import logging
+import pickle
+import sys
 import unittest
 
 # use whichever StringIO implementation is used by lljsonlog
+from llbase import lljsonlog
 from llbase.lljsonlog import JsonFormatter, StringIO
 
 class Error(Exception):
@@ -63,6 +67,60 @@ class LLJsonLogTester(LLJsonLogTestCase):
         self.assertEqual(blob["include"], "value")
         self.assertNotIn("exclude", blob)
 
+    def test_extra_overrides_field(self):
+        self.logger.info("info message", extra={"level": "custom", "other": 1})
+        blob = self.parseLastLine()
+        self.assertEqual(blob["level"], "custom")
+        self.assertEqual(blob["msg"], "info message")
+
+    def test_wide_int(self):
+        self.logger.info("info message", extra={"big": 2**70, "nested": {1: "one"}})
+        blob = self.parseLastLine()
+        self.assertEqual(blob["big"], 2**70)
+        self.assertEqual(blob["nested"], {"1": "one"})
+
+    def test_wire_format(self):
+        # every record is written the same way, whatever its extras hold
+        formatter = JsonFormatter(include_time=False)
+        for extra in ({"other": 1}, {"other": 2**70}, {"other": u"caf\xe9"},
+                      {"other": float("nan")}):
+            record = logging.LogRecord("test", logging.INFO, __file__, 1,
+                                       "info message", None, None)
+            record.__dict__.update(extra)
+            data = dict(extra, level="INFO", msg="info message", name="test")
+            self.assertEqual(formatter.format(record),
+                             json.dumps(data, sort_keys=True))
+
+    def test_plain_record(self):
+        formatter = JsonFormatter()
+        record = logging.LogRecord("test", logging.INFO, __file__, 1,
+                                   u'quote " slash \\ newline \n snowman \u2603', (), None)
+        # records without extras take a shortcut, which must serialize
+        # exactly as the full path does
+        self.assertEqual(formatter.format(record),
+                         lljsonlog._dumps({"name": "test", "level": "INFO",
+                                           "msg": record.getMessage(),
+                                           "time": formatter.formatTime(record)}))
+
+    def test_plain_record_surrogates(self):
+        # e.g. a filename from os.fsdecode(b'bad\xffname'): a lone surrogate
+        # can't be encoded to UTF-8, so it must be written escaped
+        formatter = JsonFormatter(include_time=False)
+        record = logging.LogRecord("test", logging.INFO, __file__, 1,
+                                   u'bad\udcffname', (), None)
+        line = formatter.format(record)
+        self.assertIn('bad\\udcffname', line)
+        line.encode('ascii')
+
+    def test_time_within_second(self):
+        formatter = JsonFormatter()
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "msg", (), None)
+        # same second as each other, then a whole second
+        for created in (1500000000.25, 1500000000.75, 1500000000.0, 1500000001.000001):
+            record.created = created
+            self.assertEqual(formatter.formatTime(record),
+                             datetime.fromtimestamp(created).isoformat() + 'Z')
+
 class LLJsonLogTracebackTests(LLJsonLogTestCase):
     def test_exception(self):
         try:
@@ -83,6 +141,66 @@ class LLJsonLogTracebackTests(LLJsonLogTestCase):
         # ensure cgitb output is not present
         assert "\nA problem occurred in a Python script." not in traceback
 
+    def test_exception_message_uses_str(self):
+        # KeyError's __str__() quotes its argument; that must survive
+        try:
+            raise KeyError("missing")
+        except KeyError:
+            self.logger.exception("exception happened")
+
+        blob = self.parseLastLine()
+        self.assertEqual(blob["error_message"], "'missing'")
+        self.assertEqual(blob["error_type"], "KeyError")
+
+    def test_traceback_formatted_once(self):
+        try:
+            raise Error("sample exception")
+        except Error:
+            record = self.logger.makeRecord("test", logging.ERROR, __file__, 1,
+                                            "exception happened", (), sys.exc_info())
+        formatter = JsonFormatter()
+        calls = []
+        def formatException(exc_info):
+            calls.append(exc_info)
+            return JsonFormatter.formatException(formatter, exc_info)
+        formatter.formatException = formatException
+        first = json.loads(formatter.format(record))
+        second = json.loads(formatter.format(record))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(first["traceback"], second["traceback"])
+        self.assertNotIn("_jsonlog_traceback", second)
+
+    def test_formatted_record_picklable(self):
+        try:
+            raise Error("sample exception")
+        except Error:
+            record = self.logger.makeRecord("test", logging.ERROR, __file__, 1,
+                                            "exception happened", (), sys.exc_info())
+        JsonFormatter().format(record)
+        # what SocketHandler.makePickle() sends over the wire
+        state = dict(record.__dict__, exc_info=None, args=None)
+        self.assertEqual(pickle.loads(pickle.dumps(state))["_jsonlog_traceback"],
+                         record._jsonlog_traceback)
+        self.assertEqual(record._jsonlog_traceback[0], "traceback")
+
+class LLJsonLogNoTimeTests(LLJsonLogTestCase):
+    def setUp(self):
+        super(LLJsonLogNoTimeTests, self).setUp(include_time=False)
+
+    def lastLine(self):
+        return json.loads(self.stream.getvalue().splitlines()[-1])
+
+    def test_no_time(self):
+        self.logger.info("info message")
+        self.assertEqual(self.lastLine(),
+                         {"name": "test", "level": "INFO", "msg": "info message"})
+
+    def test_no_time_extras(self):
+        self.logger.info("info message", extra={"include": "value"})
+        blob = self.lastLine()
+        self.assertNotIn("time", blob)
+        self.assertEqual(blob["include"], "value")
+
 class LLJsonLogCGITBTests(LLJsonLogTestCase):
     def setUp(self):
         super(LLJsonLogCGITBTests, self).setUp(exception_formatter="cgitb")
@@ -103,4 +221,49 @@ class LLJsonLogCGITBTests(LLJsonLogTestCase):
         traceback = blob["traceback"]
         # look for certain signature of cgitb output, in plain-text form (not HTML)
         assert "\nA problem occurred in a Python script." in traceback
-        assert "\nThe above is a description of an error in a Python program." in traceback
\ No newline at end of file
+        assert "\nThe above is a description of an error in a Python program." in traceback
+
+    def test_cgitb_successive_exceptions(self):
+        for message in ("first exception", "second exception"):
+            try:
+                raise Error(message)
+            except Error:
+                self.logger.exception("exception happened")
+
+        traceback = self.parseLastLine()["traceback"]
+        # the reused stream must not carry over the earlier exception
+        assert "second exception" in traceback
+        self.assertEqual(traceback.count("\nA problem occurred in a Python script."), 1)
+
+    def test_cgitb_nested_exception(self):
+        logger = self.logger
+
+        class Noisy(object):
+            # logs an exception of its own when cgitb repr()s it
+            logged = False
+            def __repr__(self):
+                if not self.logged:
+                    self.logged = True
+                    try:
+                        raise Error("nested exception")
+                    except Error:
+                        logger.exception("nested exception happened")
+                return "<Noisy>"
+            def fail(self):
+                raise Error("outer exception")
+
+        noisy = Noisy()
+        try:
+            # cgitb shows the variables on the failing line
+            noisy.fail()
+        except Error:
+            self.logger.exception("exception happened")
+
+        self.assertTrue(noisy.logged)
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn("nested exception", json.loads(lines[0])["traceback"])
+        traceback = self.parseLastLine()["traceback"]
+        assert "outer exception" in traceback
+        assert "nested exception" not in traceback
+        self.assertEqual(traceback.count("\nA problem occurred in a Python script."), 1)
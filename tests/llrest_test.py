@@ -0,0 +1,427 @@
+"""
+Test the llrest module
+"""
+
+from io import BytesIO
+import json
+import mock
+import os
+import unittest
+
+import requests
+from urllib3.exceptions import ProtocolError
+
+from llbase import llrest
+from llbase.llrest import RESTEncoding, RESTError, RESTService
+
+def _response(content, encoding=None):
+    """
+    Return a requests.Response whose body has already been read.
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response._content = content
+    response.encoding = encoding
+    return response
+
+class LLRESTErrorMessageTests(unittest.TestCase):
+    """
+    This class aggregates tests of formatting RESTError's message.
+    """
+    def testFormat(self):
+        """
+        Test that the message can refer to the parameters and to extra
+        keywords.
+        """
+        err = RESTError('test', 'http://example.com/', 404,
+                        u'{url} said {status}: {reason}', reason=u'caf\xe9')
+        self.assertEqual(u'test: http://example.com/ said 404: caf\xe9', err.msg)
+        self.assertEqual(404, err.status)
+
+    def testNoFormat(self):
+        """
+        Test a message with no references.
+        """
+        self.assertEqual('test: plain', RESTError('test', 'url', 0, 'plain').msg)
+
+class LLRESTJSONTests(unittest.TestCase):
+    """
+    This class aggregates tests of the JSON codec.
+    """
+    def setUp(self):
+        self.codec = RESTEncoding.JSON()
+
+    def testEncode(self):
+        """
+        Test that encode() returns json's compact text for the same data.
+        """
+        for data in ({'name': u'caf\xe9', 'ids': [1, 2]},
+                     {'nan': float('nan')}, {'big': 2**70}):
+            encoded = self.codec.encode(data)
+            self.assertTrue(isinstance(encoded, str))
+            self.assertEqual(json.dumps(data, separators=(',', ':')), encoded)
+
+    def testDecode(self):
+        """
+        Test decoding a UTF-8 body.
+        """
+        self.assertEqual({u'name': u'caf\xe9', u'ids': [1, 2]},
+                         self.codec.decode(_response(
+                             u'{"name": "caf\xe9", "ids": [1, 2]}'.encode('utf-8'))))
+
+    def testDecodeNotUTF8(self):
+        """
+        Test decoding a body that only requests can read.
+        """
+        self.assertEqual({u'name': u'caf\xe9'},
+                         self.codec.decode(_response(
+                             u'{"name": "caf\xe9"}'.encode('utf-16'))))
+
+    def testDecodeNaN(self):
+        """
+        Test decoding what encode() writes for NaN.
+        """
+        decoded = self.codec.decode(_response(b'{"x": NaN}'))
+        self.assertNotEqual(decoded['x'], decoded['x'])
+
+    def testDecodeInvalid(self):
+        """
+        Test that decoding a body that isn't json raises ValueError.
+        """
+        self.assertRaises(ValueError, self.codec.decode, _response(b'<html>'))
+
+class LLRESTCodecTests(unittest.TestCase):
+    """
+    This class aggregates tests of switching a service's codec.
+    """
+    def setUp(self):
+        self.service = RESTService('test', 'http://example.com/service',
+                                   codec=RESTEncoding.JSON, authenticated=False)
+        self.service.session.post = mock.Mock(side_effect=self._post)
+
+    def _post(self, url, data, **kwds):
+        """
+        Stand in for Session.post(), echoing the request body.
+        """
+        response = _response(data if isinstance(data, bytes) else data.encode('utf-8'))
+        response.request = mock.Mock(url=url)
+        return response
+
+    def testTempCodec(self):
+        """
+        Test that requests use the codec set by temp_codec(), and the
+        previous one again afterwards.
+        """
+        self.assertEqual({'a': 1}, self.service.post('path', {'a': 1}))
+        with self.service.temp_codec(RESTEncoding.LLSDXML):
+            self.assertEqual('application/llsd+xml',
+                             self.service.session.headers['Content-Type'])
+            self.assertEqual({'a': 1}, self.service.post('path', {'a': 1}))
+            self.assertTrue(self.service.session.post.call_args[1]['data']
+                            .startswith(b'<llsd>'))
+        self.assertEqual('application/json',
+                         self.service.session.headers['Content-Type'])
+        self.assertEqual({'a': 1}, self.service.post('path', {'a': 1}))
+        self.assertEqual('{"a":1}',
+                         self.service.session.post.call_args[1]['data'])
+
+    def testDecodeErrorNamesCodec(self):
+        """
+        Test that a decode failure names the codec in use.
+        """
+        with self.service.temp_codec(RESTEncoding.LLSDXML):
+            self.service.session.post.side_effect = \
+                lambda url, data, **kwds: self._post(url, b'not llsd')
+            with self.assertRaises(RESTError) as cm:
+                self.service.post('path', {'a': 1})
+        self.assertIn('LLSDXML decoding', cm.exception.msg)
+
+    def testAssignCodec(self):
+        """
+        Test that assigning the codec attribute directly changes how requests
+        are encoded, decoded and reported.
+        """
+        self.service.codec = RESTEncoding.LLSDXML()
+        self.assertEqual({'a': 1}, self.service.post('path', {'a': 1}))
+        self.assertTrue(self.service.session.post.call_args[1]['data']
+                        .startswith(b'<llsd>'))
+        self.service.session.post.side_effect = \
+            lambda url, data, **kwds: self._post(url, b'not llsd')
+        with self.assertRaises(RESTError) as cm:
+            self.service.post('path', {'a': 1})
+        self.assertIn('LLSDXML decoding', cm.exception.msg)
+
+class LLRESTCloneTests(unittest.TestCase):
+    """
+    This class aggregates tests of clone().
+    """
+    def setUp(self):
+        self.service = RESTService('test', 'http://example.com/service',
+                                   authenticated=False, pool_size=4)
+
+    def testClone(self):
+        """
+        Test that a clone has its own Session and connection pools.
+        """
+        clone = self.service.clone()
+        self.assertEqual(self.service.baseurl, clone.baseurl)
+        self.assertEqual(4, clone.pool_size)
+        self.assertFalse(clone.session is self.service.session)
+        for url in ('http://example.com/', 'https://example.com/'):
+            self.assertFalse(clone.session.get_adapter(url)
+                             is self.service.session.get_adapter(url))
+
+    def testCloneSharePool(self):
+        """
+        Test that a clone made with share_pool=True has its own Session
+        using the original's connection pools.
+        """
+        self.service.enable_old_tls()
+        clone = self.service.clone(share_pool=True)
+        self.assertFalse(clone.session is self.service.session)
+        for url in ('http://example.com/', 'https://example.com/'):
+            self.assertTrue(clone.session.get_adapter(url)
+                            is self.service.session.get_adapter(url))
+
+class LLRESTErrorTests(unittest.TestCase):
+    """
+    This class aggregates tests of the RESTError raised for an HTTP error.
+    """
+    def setUp(self):
+        self.service = RESTService('test', 'http://example.com/service',
+                                   codec=RESTEncoding.JSON, authenticated=False)
+
+    def _fail(self, body):
+        """
+        Make the service's GET requests fail with status 500 and body.
+        """
+        def get(url, **kwds):
+            response = _response(body)
+            response.status_code = 500
+            response.reason = 'Internal Server Error'
+            response.url = url
+            return response
+        self.service.session.get = mock.Mock(side_effect=get)
+
+    def testDecodedBody(self):
+        """
+        Test that an error body the codec understands is shown decoded.
+        """
+        self._fail(b'{"error": "broken"}')
+        with self.assertRaises(RESTError) as cm:
+            self.service.get('path')
+        self.assertEqual(500, cm.exception.status)
+        self.assertIn("{'error': 'broken'}", cm.exception.msg)
+
+    def testTextBody(self):
+        """
+        Test that an error body the codec doesn't understand is shown as is.
+        """
+        self._fail(b'<html>broken</html>')
+        with self.assertRaises(RESTError) as cm:
+            self.service.get('path')
+        self.assertIn('<html>broken</html>', cm.exception.msg)
+
+    def testBigBody(self):
+        """
+        Test that only the start of a big error body is shown, undecoded.
+        """
+        self._fail(b'[' + b'1, ' * llrest._ERROR_BODY_LIMIT + b'1]')
+        with mock.patch.object(RESTEncoding.JSON, 'decode') as decode:
+            with self.assertRaises(RESTError) as cm:
+                self.service.get('path')
+        self.assertFalse(decode.called)
+        self.assertIn('[1, 1, 1, ', cm.exception.msg)
+        self.assertTrue(cm.exception.msg.endswith('...'))
+        self.assertTrue(len(cm.exception.msg) < llrest._ERROR_BODY_LIMIT + 512)
+
+class LLRESTProxyTests(unittest.TestCase):
+    """
+    This class aggregates tests of which proxy requests go through.
+    """
+    def _proxies(self, service):
+        """
+        Make a GET request with service, and return the proxies the
+        connection adapter was asked to use.
+        """
+        sent = {}
+        def send(request, **kwds):
+            # the environment is left alone while the request is made
+            self.assertEqual('http://envproxy:1', os.environ.get('http_proxy'))
+            sent.update(kwds['proxies'])
+            response = _response(b'')
+            response.request = request
+            return response
+        with mock.patch.object(requests.adapters.HTTPAdapter, 'send',
+                               side_effect=send):
+            service.get('path')
+        return sent
+
+    @mock.patch.dict(os.environ, {'http_proxy': 'http://envproxy:1'})
+    def testProxyHostport(self):
+        """
+        Test that proxy_hostport wins over http_proxy in the environment.
+        """
+        service = RESTService('test', 'http://example.com/service',
+                              authenticated=False, proxy_hostport='myproxy:2')
+        self.assertEqual('http://myproxy:2', self._proxies(service)['http'])
+
+    @mock.patch.dict(os.environ, {'http_proxy': 'http://envproxy:1'})
+    def testNoProxy(self):
+        """
+        Test that http_proxy in the environment is ignored.
+        """
+        service = RESTService('test', 'http://example.com/service',
+                              authenticated=False)
+        self.assertEqual(None, self._proxies(service).get('http'))
+
+    @mock.patch.dict(os.environ, {'http_proxy': 'http://envproxy:1',
+                                  'https_proxy': 'http://envhttps:3',
+                                  'no_proxy': 'internal.local'})
+    def testNoProxyAfterOtherHost(self):
+        """
+        Test that the environment's no_proxy holds for a request made after
+        one to a host that does go through the environment's proxy.
+        """
+        for proxy_hostport, expected in ((None, None), ('myproxy:2', 'http://myproxy:2')):
+            service = RESTService('test', 'https://outside.example',
+                                  authenticated=False, proxy_hostport=proxy_hostport)
+            session_proxies = dict(service.session.proxies or {})
+            self.assertEqual(expected or 'http://envhttps:3',
+                             self._proxies(service).get('https'))
+            service.baseurl = 'https://internal.local'
+            self.assertEqual(expected, self._proxies(service).get('https'))
+            self.assertEqual(session_proxies, service.session.proxies or {})
+
+class LLRESTConvenienceTests(unittest.TestCase):
+    """
+    This class aggregates tests of the module-level request functions.
+    """
+    def testResolveArgs(self):
+        """
+        Test that keywords are split between the service and the request.
+        """
+        svc, kwds = llrest._resolve_args('get', 'http://example.com/x',
+                                         dict(codec=RESTEncoding.JSON,
+                                              authenticated=False,
+                                              params={'a': 1}, timeout=5))
+        self.assertEqual('temp get', svc.name)
+        self.assertEqual('http://example.com/x', svc.baseurl)
+        self.assertFalse(svc.authenticated)
+        self.assertTrue(isinstance(svc.codec, RESTEncoding.JSON))
+        self.assertEqual(dict(params={'a': 1}, timeout=5), kwds)
+
+class LLRESTStreamingTests(unittest.TestCase):
+    """
+    This class aggregates tests of decoding a response body as it arrives,
+    as the XML codec does.
+    """
+    URL = 'http://example.com/service/path'
+
+    def setUp(self):
+        self.service = RESTService('test', 'http://example.com/service',
+                                   codec=RESTEncoding.XML, authenticated=False)
+        self.service.session.get = mock.Mock(side_effect=self._get)
+
+    def _get(self, url, **kwds):
+        """
+        Stand in for Session.get(), returning self.raw's body unread.
+        """
+        self.assertTrue(kwds.get('stream'))
+        response = requests.Response()
+        response.status_code = self.status
+        response.headers.update(self.headers)
+        response.encoding = self.encoding
+        response.raw = self.raw
+        response.request = mock.Mock(url=url)
+        return response
+
+    def _serve(self, body=None, encoding=None, error=None):
+        """
+        Set up the response body to return, or the error to raise reading it.
+        """
+        def stream(chunk_size, decode_content):
+            # as urllib3.HTTPResponse.stream() does
+            if error is not None:
+                raise error
+            stream = BytesIO(body)
+            chunk = stream.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = stream.read(chunk_size)
+
+        self.status = 200
+        self.headers = {}
+        self.encoding = encoding
+        self.raw = mock.Mock(spec=['stream', 'close', 'release_conn'])
+        self.raw.stream.side_effect = stream
+
+    def testDecode(self):
+        """
+        Test decoding a body read a chunk at a time.
+        """
+        body = b'<root>' + b'<a>1</a>' * (llrest._STREAM_CHUNK_SIZE // 4) + b'</root>'
+        self._serve(body)
+        root = self.service.get('path')
+        self.assertEqual('root', root.tag)
+        self.assertEqual(llrest._STREAM_CHUNK_SIZE // 4, len(root))
+        self.raw.stream.assert_called_once_with(llrest._STREAM_CHUNK_SIZE,
+                                                decode_content=True)
+        self.assertTrue(self.raw.release_conn.called)
+
+    def testEmpty(self):
+        """
+        Test that an empty body isn't passed to the codec.
+        """
+        self._serve(b'')
+        self.assertEqual("", self.service.get('path'))
+        self.assertTrue(self.raw.release_conn.called)
+
+    def testNoContent(self):
+        """
+        Test that a response whose headers say it has no body isn't read.
+        """
+        for status, headers in ((204, {}), (200, {'Content-Length': '0'})):
+            self._serve(b'')
+            self.status = status
+            self.headers = headers
+            self.assertEqual("", self.service.get('path'))
+            self.assertFalse(self.raw.stream.called)
+            self.assertTrue(self.raw.release_conn.called)
+
+    def testParseError(self):
+        """
+        Test that a body that isn't XML raises RESTError showing its start.
+        """
+        self._serve(b'<root><a>')
+        with self.assertRaises(RESTError) as cm:
+            self.service.get('path')
+        self.assertEqual(200, cm.exception.status)
+        self.assertEqual(self.URL, cm.exception.url)
+        self.assertIn('<root><a>', cm.exception.msg)
+        self.assertTrue(self.raw.release_conn.called)
+
+    def testParseErrorUnknownCharset(self):
+        """
+        Test that a response claiming a charset Python doesn't know still
+        raises RESTError.
+        """
+        self._serve(b'<root><a>', encoding='x-no-such-charset')
+        with self.assertRaises(RESTError) as cm:
+            self.service.get('path')
+        self.assertIn('<root><a>', cm.exception.msg)
+        self.assertTrue(self.raw.release_conn.called)
+
+    def testReadError(self):
+        """
+        Test that failing to read the body raises RESTError.
+        """
+        self._serve(error=ProtocolError('connection broken'))
+        with self.assertRaises(RESTError) as cm:
+            self.service.get('path')
+        self.assertEqual(self.URL, cm.exception.url)
+        self.assertIn('connection broken', cm.exception.msg)
+        self.assertTrue(self.raw.release_conn.called)
+
+if __name__ == '__main__':
+    unittest.main()